@@ -0,0 +1,222 @@
+"""
+Benchmarks of CheSweet's hot paths: loading the look-up tables, computing
+chemical shifts (one conformation at a time and in batches) and computing
+torsional angles.
+
+Run it from the root of the repository, results are written as JSON so
+they can be compared between releases:
+
+    python benchmarks/bench_chesweet.py -o benchmarks.json
+
+and compared with the results of a previous run with:
+
+    python benchmarks/bench_chesweet.py --compare old.json
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from os.path import abspath, dirname
+
+import numpy as np
+import scipy
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+import chesweet as chsw
+
+
+DISACCHARIDES = {'1-1': 'a-D-Glcp-1-1-a-D-Glcp',
+                 '1-4': 'a-D-Glcp-1-4-a-D-Glcp',
+                 '1-6': 'a-D-Glcp-1-6-a-D-Glcp'}
+
+
+def conformations(chesweet, disaccharide, kind, n, seed=0):
+    """
+    Torsional angles of `n` conformations of a given kind: `inside` cells
+    with four computed corners, `border` cells with one to three computed
+    corners and `outside` cells without computed corners.
+    """
+    name = chesweet.tables[disaccharide].key
+    grid = chesweet.grid[name][..., 0]
+    axes = chesweet.grid_axes[name]
+    # use the first rotamer computed for all the chi axes
+    rotamer = np.unravel_index(np.argmax(np.sum(~np.isnan(grid), axis=(0, 1))),
+                               grid.shape[2:])
+    computed = ~np.isnan(grid[(slice(None), slice(None)) + rotamer])
+    n_corners = (computed[:-1, :-1].astype(int) + computed[1:, :-1] +
+                 computed[:-1, 1:] + computed[1:, 1:])
+    if kind == 'inside':
+        cells = np.argwhere(n_corners == 4)
+    elif kind == 'border':
+        cells = np.argwhere((n_corners > 0) & (n_corners < 4))
+    else:
+        cells = np.argwhere(n_corners == 0)
+    rng = np.random.RandomState(seed)
+    cells = cells[rng.randint(len(cells), size=n)]
+    phi = axes[0][cells[:, 0]] + rng.uniform(0, 10, n)
+    psi = axes[1][cells[:, 1]] + rng.uniform(0, 10, n)
+    chis = [np.full(n, axis[idx]) for axis, idx in zip(axes[2:], rotamer)]
+    if chesweet.full and disaccharide == DISACCHARIDES['1-1']:
+        chis = chis[:2]
+    return [phi, psi] + chis
+
+
+def bench(func, number, repeat):
+    """
+    Best and median time per call of `func`, in seconds.
+    """
+    times = np.array(timeit.repeat(func, number=number, repeat=repeat)) / number
+    return {'best': float(times.min()), 'median': float(np.median(times)),
+            'number': number, 'repeat': repeat}
+
+
+def bench_load(repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        packed = chsw.pack_lut(tmp + '/lut.npz')
+        for full in (False, True):
+            for source in ('text', 'cache', 'packed'):
+                def load():
+                    if source == 'packed':
+                        chesweet = chsw.CheSweet(path=packed, full=full)
+                    else:
+                        chesweet = chsw.CheSweet(full=full,
+                                                 cache=source == 'cache')
+                    chesweet.preload()
+                    return chesweet
+
+                # build the binary copy of the tables before timing
+                chesweet = load()
+                result = bench(load, 1, repeat)
+                tracemalloc.start()
+                load()
+                result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                result['table_bytes'] = int(sum(chesweet.lt[d].nbytes
+                                                for d in chesweet.lt))
+                results['full={},{}'.format(full, source)] = result
+    return results
+
+
+def bench_compute_cs(n_scalar, n_batch, repeat):
+    results = {}
+    for full in (False, True):
+        chesweet = chsw.CheSweet(full=full, disaccharides=DISACCHARIDES.values())
+        for bond, disaccharide in DISACCHARIDES.items():
+            for kind in ('inside', 'border', 'outside'):
+                key = 'full={},{},{}'.format(full, bond, kind)
+                tors = conformations(chesweet, disaccharide, kind, n_batch)
+                scalar = [tor[:n_scalar].tolist() for tor in tors]
+
+                def compute_scalar():
+                    for args in zip(*scalar):
+                        chesweet.compute_cs(disaccharide, *args)
+
+                def compute_batch():
+                    chesweet.compute_cs_many(disaccharide, *tors)
+
+                result = bench(compute_scalar, 1, repeat)
+                result['conformations_per_second'] = n_scalar / result['best']
+                results['scalar,' + key] = result
+                result = bench(compute_batch, 1, repeat)
+                result['conformations_per_second'] = n_batch / result['best']
+                results['batch,' + key] = result
+    return results
+
+
+def bench_compute_tors(n_queries, repeat, eps_values=(0.1, 0.5, 1., 2.)):
+    results = {}
+    for full in (False, True):
+        chesweet = chsw.CheSweet(full=full, disaccharides=DISACCHARIDES.values())
+        for bond, disaccharide in DISACCHARIDES.items():
+            name = chesweet.tables[disaccharide].key
+            rng = np.random.RandomState(0)
+            shieldings = chesweet.lt[name][:, -2:]
+            cs = 183.4 - shieldings[rng.randint(len(shieldings), size=n_queries)]
+            cs += rng.normal(0, 0.5, cs.shape)
+            for eps in eps_values:
+                key = 'full={},{},eps={}'.format(full, bond, eps)
+
+                def compute_scalar():
+                    for cs0, cs1 in cs:
+                        chesweet.compute_tors(disaccharide, cs0, cs1, eps=eps)
+
+                def compute_batch():
+                    chesweet.compute_tors_many(disaccharide, cs[:, 0], cs[:, 1],
+                                               eps=eps)
+
+                result = bench(compute_scalar, 1, repeat)
+                result['queries_per_second'] = n_queries / result['best']
+                results['scalar,' + key] = result
+                result = bench(compute_batch, 1, repeat)
+                result['queries_per_second'] = n_queries / result['best']
+                results['batch,' + key] = result
+    return results
+
+
+def compare(results, reference, threshold=1.2):
+    """
+    List the benchmarks whose best time changed more than `threshold` times
+    with respect to `reference`.
+    """
+    changes = []
+    for group, benchmarks in results.items():
+        if group == 'metadata':
+            continue
+        for name, result in benchmarks.items():
+            old = reference.get(group, {}).get(name)
+            if old is None:
+                continue
+            ratio = result['best'] / old['best']
+            if ratio > threshold or ratio < 1 / threshold:
+                changes.append((group, name, ratio))
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file for the results, stdout by default')
+    parser.add_argument('--quick', action='store_true',
+                        help='use fewer conformations and repetitions')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file with the results of a previous run, '
+                             'benchmarks that changed are listed in stderr')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        repeat, n_scalar, n_batch, n_queries = 2, 20, 10000, 20
+    else:
+        repeat, n_scalar, n_batch, n_queries = 5, 200, 1000000, 200
+
+    results = {
+        'metadata': {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'scipy': scipy.__version__,
+                     'platform': platform.platform()},
+        'load': bench_load(repeat),
+        'compute_cs': bench_compute_cs(n_scalar, n_batch, repeat),
+        'compute_tors': bench_compute_tors(n_queries, repeat),
+    }
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as fh:
+            reference = json.load(fh)
+        for group, name, ratio in compare(results, reference):
+            status = 'slower' if ratio > 1 else 'faster'
+            sys.stderr.write('{} {}: {:.2f}x {}\n'.format(group, name, ratio,
+                                                           status))
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,3 @@
 from .chesweet import *
+from .glycan import Glycan, read_pdb
+from .ensemble import EnsembleAverage, fit_populations, fit_lut_populations
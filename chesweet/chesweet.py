@@ -1,11 +1,18 @@
 import glob
+import hashlib
+import json
+import os
 from os.path import basename as bn
 import pkg_resources as pkg
 from os.path import join
 import sys
 import math
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from collections.abc import Mapping
 import numpy as np
-from scipy.interpolate import griddata
+from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+from scipy.spatial import cKDTree
 
 
 class CheSweet():
@@ -13,30 +20,148 @@ class CheSweet():
     Class to compute chemical shift or torsional angles of glycosidics bonds.
     """
 
-    def __init__(self, path=None, full=False):
+    def __init__(self, path=None, full=False, cache=True, disaccharides=None,
+                 stats=None, cell_cache=None, compact=False):
         """
         Parameters
         ----------
         path : string
-            folder of lookup table, if None (default) CheSweet's lookup table will be used
+            folder of lookup table, if None (default) CheSweet's lookup table will be used.
+            It can also be a single `.npz` file with all the tables (see
+            `pack_lut`) or a backend object (see `LutDirectory`)
         full : Boolean
             whether to include chi's torsional angles (True) in the computation
             of chemical shifts or not (False)
+        cache : Boolean or string
+            whether to keep a binary copy of the lookup table to speed up
+            the loading (True, default) or not (False). The copy is stored in
+            the user's cache folder, a string can be used to choose another
+            folder. The binary copy is rebuilt when the lookup table changes.
+            Only used for folders of lut files
+        disaccharides : list
+            names of the disaccharides to use, if None (default) all the
+            disaccharides in the lookup table are available. The lookup
+            table of each disaccharide is loaded the first time it is needed,
+            unless they are listed here, then they are loaded right away
+        stats : Stats
+            if given, timings and counters of the computations are recorded
+            in it, see `Stats`. It can also be set later using the `stats`
+            attribute. By default (None) nothing is recorded
+        cell_cache : int
+            if given, the interpolators of the last `cell_cache` grid cells
+            used by `compute_cs` are kept, so conformations that fall again in
+            the same cell (and chi rotamers) are computed without filtering
+            and triangulating the look-up table again, see `CellCache`. By
+            default (None) nothing is kept
+        compact : Boolean
+            whether to store the look-up tables compactly (True), with the
+            torsional angles as small integer indices and the shieldings as
+            single precision floats, see `CompactTable`, or not (False,
+            default). Compact tables use about 3 (reduced) to 4.5 (full)
+            times less memory, and about 2.2 to 3 times less counting the
+            grids built to compute chemical shifts. The search tree used by
+            `compute_tors` is not compacted
         """
         self.full = full
-        
-        if path is None:
-            files = pkg.resource_filename(__name__, '/'.join(['lut']))
+        self.compact = compact
+        self.stats = stats
+        if cell_cache is None:
+            self.cell_cache = None
         else:
-            files = '/'.join([path, 'lut'])
+            self.cell_cache = CellCache(cell_cache)
         
-        if full:
-            self.disaccharides = glob.glob('{}/*[!_red]'.format(files))
+        if path is None:
+            path = pkg.resource_filename(__name__, '/'.join(['lut']))
+            self.backend = LutDirectory(path, cache)
+        elif not isinstance(path, str):
+            self.backend = path
+        elif path.endswith('.npz'):
+            self.backend = PackedLut(path)
         else:
-            self.disaccharides = glob.glob('{}/*_red'.format(files))
+            self.backend = LutDirectory('/'.join([path, 'lut']), cache)
+        self.cache_dir = getattr(self.backend, 'cache_dir', None)
+
+        # names of the lut files, reduced tables end with _red
+        self.disaccharides = [name for name in self.backend.names()
+                              if name.endswith('_red') != full]
+
+        if disaccharides is not None:
+            names = [d if full else d + '_red' for d in disaccharides]
+            missing = set(names) - set(self.disaccharides)
+            if missing:
+                raise ValueError('{} not in the look-up table'.format(
+                    ', '.join(sorted(missing))))
+            self.disaccharides = [d for d in self.disaccharides if d in names]
 
         self.lt = _load(self)
+        self.tables = _LazyDict([_parse_name(d)[0] for d in self.disaccharides],
+                                self._load_table_info)
+        self.grid_axes = _LazyDict(self.lt, self._load_grid_axes)
+        self._grid_rows = _LazyDict(self.lt, self._load_grid_rows)
+        self.grid = _LazyDict(self.lt, self._load_grid)
+        self._diagonals = _LazyDict(self.lt, self._load_diagonals)
+        self._cs_tree = _LazyDict(self.lt, self._load_cs_tree)
+        # least recently used trees of weighted shieldings, keyed by
+        # (disaccharide, relative weights)
+        self._weighted_trees = CellCache(8)
+        self._interpolators = _LazyDict(self.lt, self._load_interpolator)
+
+        if disaccharides is not None:
+            self.preload()
+
+    def preload(self):
+        """
+        Load the look-up table of all the disaccharides, instead of waiting
+        until they are needed for the first time.
+        """
+        for disaccharide in self.lt:
+            self.grid[disaccharide]
+
+    def _load_table_info(self, name):
+        key = name if self.full else name + '_red'
+        table = self.lt[key]
+        _, donor, position = _parse_name(key)
+        axes = self.grid_axes[key]
+        if self.full:
+            columns = ('phi', 'psi', 'chi1', 'chi2', 'chi3')
+            if position == 1:# bonds 1-1 (a Chi less)
+                columns = columns[:4]
+        elif position == 6:# omega
+            columns = ('phi', 'psi', 'omega')
+        else:
+            columns = ('phi', 'psi')
+        shieldings = table[:, -2:]
+        return TableInfo(name, key, self.full, donor, position, columns, axes,
+                         axes[2:len(columns)], len(table),
+                         np.column_stack([shieldings.min(axis=0),
+                                          shieldings.max(axis=0)]))
+
+    def _load_grid_axes(self, disaccharide):
+        return _grid_axes(self.lt[disaccharide], self.full)
 
+    def _load_grid_rows(self, disaccharide):
+        table = self.lt[disaccharide]
+        if self.compact and len(table) < np.iinfo(np.int16).max:
+            dtype = np.int16
+        else:
+            dtype = np.int32
+        return _build_grid(table, self.grid_axes[disaccharide], dtype)
+
+    def _load_grid(self, disaccharide):
+        return _grid_shieldings(self.lt[disaccharide],
+                                self._grid_rows[disaccharide],
+                                np.float32 if self.compact else float)
+
+    def _load_diagonals(self, disaccharide):
+        return _cell_diagonals(self._grid_rows[disaccharide])
+
+    def _load_cs_tree(self, disaccharide):
+        return cKDTree(self.lt[disaccharide][:, -2:])
+
+    def _load_interpolator(self, disaccharide):
+        return Interpolator(self.grid[disaccharide],
+                            self.grid_axes[disaccharide],
+                            self._diagonals[disaccharide])
 
     def compute_cs(self, disaccharide, phi, psi, chi1=None, chi2=None,
                    chi3=None, ef_corr=183.4):
@@ -74,9 +199,13 @@ class CheSweet():
             the glycosidic bond
         """
 
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
         lt = self.lt
-        if not self.full:
-            disaccharide = disaccharide + '_red'
+        info = self.tables[disaccharide]
+        disaccharide = info.key
+        axes = info.axes
         # phi and psi angles in lt are compute using a 10 degree grid.
         phi_range = _round_down_up(phi, 10)
         psi_range = _round_down_up(psi, 10)
@@ -88,47 +217,231 @@ class CheSweet():
                 chi3_n = 0
             else:
                 chi3_n = _nearest_chi(chi3)
-            s_db = lt[disaccharide][(lt[disaccharide][:, 0] >= phi_range[0]) &
-                                    (lt[disaccharide][:, 0] <= phi_range[1])]
-
-            ss_db = s_db[(s_db[:, 1] >= psi_range[0]) &
-                         (s_db[:, 1] <= psi_range[1])]
-            
-            data = ss_db[(ss_db[:, 2] == chi1_n) & (
-                ss_db[:, 3] == chi2_n) & (ss_db[:, 4] == chi3_n)]
+            chis_n = [chi1_n, chi2_n, chi3_n]
+        # phi, psi, chemical shift C1, chemical shift Cx
+        elif len(info.columns) == 2:
+            chis_n = []
+        # phi, psi, omega, chemical shift C1, chemical shift Cx
         else:
-            s_lt = lt[disaccharide][(lt[disaccharide][:, 0] >= phi_range[0]) &
-                                    (lt[disaccharide][:, 0] <= phi_range[1])]
-            ss_lt = s_lt[(s_lt[:, 1] >= psi_range[0]) &
-                         (s_lt[:, 1] <= psi_range[1])]
-
-            # phi, psi, chemical shift C1, chemical shift Cx
-            if lt[disaccharide].shape[1] == 4:
-                data = ss_lt
-            # phi, psi, omega, chemical shift C1, chemical shift Cx
-            elif lt[disaccharide].shape[1] == 5:
-                omega_n = _nearest_chi(chi1)
-                data = ss_lt[(ss_lt[:, 2] == omega_n)]
-
-        d_shape = data.shape[0]
-        # we are outside the zone of computed values
-        if d_shape == 0:
+            chis_n = [_nearest_chi(chi1)]
+        if stats is not None:
+            stats.time('rounding', time.perf_counter() - start)
+            start = time.perf_counter()
+
+        key = (disaccharide, phi_range, psi_range, tuple(chis_n))
+        cell_cache = self.cell_cache
+        if cell_cache is not None and key in cell_cache:
+            d_shape, interpolator = cell_cache[key]
+        else:
+            # rows of lt at the corners of the grid cell, in the order of lt
+            cell = [slice(*np.searchsorted(axes[0], phi_range) + [0, 1]),
+                    slice(*np.searchsorted(axes[1], psi_range) + [0, 1])]
+            for axis, chi_n in zip(axes[2:], chis_n):
+                cell.append(slice(*np.searchsorted(axis, [chi_n, chi_n]) +
+                                  [0, 1]) if chi_n in axis else slice(0, 0))
+            rows = self._grid_rows[disaccharide][tuple(cell)]
+            data = lt[disaccharide][np.sort(rows[rows >= 0])]
+            if stats is not None:
+                stats.time('filter', time.perf_counter() - start)
+                start = time.perf_counter()
+
+            d_shape = data.shape[0]
+            # we are outside the zone of computed values
+            if d_shape == 0:
+                interpolator = None
+            # we hit a border of the computed values!
+            elif d_shape < 4:
+                interpolator = NearestNDInterpolator(data[:, :2], data[:, -2:])
+            # life is sweet!
+            elif d_shape == 4:
+                interpolator = LinearNDInterpolator(data[:, :2], data[:, -2:])
+            if cell_cache is not None:
+                cell_cache[key] = (d_shape, interpolator)
+
+        # this is the same as scipy's griddata, without triangulating the
+        # cell each time
+        if interpolator is None:
             cs = np.array([np.inf, np.inf])
-        # we hit a border of the computed values!
-        elif d_shape < 4:
-            cs = ef_corr - griddata(data[:, :2],
-                                    data[:, -2:],
-                                    (phi, psi),
-                                    method='nearest')
-        # life is sweet!
-        elif d_shape == 4:
-            cs = ef_corr - griddata(data[:, :2],
-                                    data[:, -2:],
-                                    (phi, psi),
-                                    method='linear')
+        else:
+            cs = ef_corr - interpolator((phi, psi))
+        if stats is not None:
+            stats.time('griddata', time.perf_counter() - start)
+            stats.count('queries')
+            if d_shape == 0:
+                stats.count('outside')
+            elif d_shape < 4:
+                stats.count('border')
         return cs
 
-    def compute_tors(self, disaccharide, cs0, cs1, ef_corr=183.4, eps=0.5):
+    def compute_cs_many(self, disaccharide, phi, psi, chi1=None, chi2=None,
+                        chi3=None, ef_corr=183.4):
+        """
+        Compute the chemical shifts for many sets of torsional angles at once,
+        e.g. all the frames of a MD trajectory.
+
+        Instead of filtering the look-up table and triangulating the
+        neighbours of each conformation, the cell of the 10 degree phi/psi
+        grid is found by direct indexing and interpolated linearly inside the
+        same two triangles used by `compute_cs`, so both functions give the
+        same values. As in `compute_cs`, conformations outside the zone of
+        computed values get `inf` and conformations at a border (less than
+        four computed corners) get the value of the nearest computed corner.
+
+        Parameters
+        ----------
+        disaccharide : string
+            disaccharides names used as keys in lt dictionary
+        phi : array_like
+            phi torsional angles in degrees
+        psi : array_like
+            psi torsional angles in degrees
+        chi1 : array_like
+            chi1 (or omega for reduced 1-6 bonds) torsional angles in degrees
+            (optional)
+        chi2 : array_like
+            chi2 torsional angles in degrees (optional)
+        chi3 : array_like
+            chi3 torsional angles in degrees (optional)
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+
+        Returns
+        ----------
+        cs : array
+            (N, 2) array with the interpolated chemical shifts of the first
+            and second carbon in the glycosidic bond for each conformation
+        """
+        return self.interpolator(disaccharide)(phi, psi, chi1, chi2, chi3,
+                                               ef_corr=ef_corr,
+                                               stats=self.stats)
+
+    def compute_cs_uncertainty(self, disaccharide, phi, psi, chi1=None,
+                               chi2=None, chi3=None, std=None, method='linear',
+                               n_samples=100, seed=None, ef_corr=183.4):
+        """
+        Compute the mean and standard deviation of the chemical shifts of
+        conformations with uncertain torsional angles.
+
+        The uncertainty of the torsional angles can be given as standard
+        deviations (`std`) or as clouds of samples of each conformation
+        (angles with shape (N, n_samples)). Standard deviations are
+        propagated using the derivatives of the linear interpolation
+        (`method='linear'`), which only takes into account the uncertainty
+        of phi and psi, or by sampling normal deviations of all the angles
+        (`method='montecarlo'`). Samples outside the zone of computed values
+        are not used, conformations without any sample inside it get `inf`.
+
+        Parameters
+        ----------
+        disaccharide : string
+            disaccharides names used as keys in lt dictionary
+        phi, psi, chi1, chi2, chi3 : array_like
+            torsional angles in degrees, see `compute_cs_many`. With `std`
+            None (default) arrays with shape (N, n_samples) (or (n_samples,)
+            for a single conformation) are clouds of samples of each
+            conformation, and angles with shape (N,) given along with them
+            are the same for all the samples of each conformation
+        std : float or array_like
+            standard deviation of the torsional angles in degrees, one value
+            for all of them or one value for each of phi, psi, chi1, chi2 and
+            chi3, or an (N, 5) array with different values for each
+            conformation
+        method : string
+            `linear` (default) or `montecarlo`, used with `std`
+        n_samples : int
+            number of samples of each conformation for `montecarlo`. Default
+            value is 100
+        seed : int
+            seed of the random numbers used by `montecarlo` (optional)
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+
+        Returns
+        ----------
+        cs : array
+            mean chemical shifts of the first and second carbon in the
+            glycosidic bond, with shape (2,) for a single conformation or
+            (N, 2)
+        cs_std : array
+            standard deviation of the chemical shifts, with the same shape as
+            `cs`
+        """
+        interpolator = self.interpolator(disaccharide)
+        tors = [phi, psi, chi1, chi2, chi3]
+        # samples are not counted in stats, each conformation is counted once
+        sampled = std is None or method == 'montecarlo'
+        if self.stats is not None:
+            start_time = time.perf_counter()
+        if std is None:
+            scalar = max(np.ndim(tor) for tor in tors) < 2
+            tors = [np.asarray(np.nan if tor is None else tor, dtype=float)
+                    for tor in tors]
+            if not scalar:
+                # one value for all the samples of each conformation
+                tors = [tor[:, None] if tor.ndim == 1 else tor for tor in tors]
+            tors = np.broadcast_arrays(*[np.atleast_2d(tor) for tor in tors])
+            samples = interpolator(*[tor.ravel() for tor in tors],
+                                   ef_corr=ef_corr)
+            cs, cs_std = _cloud_stats(samples.reshape(tors[0].shape + (2,)))
+        else:
+            if method not in ('linear', 'montecarlo'):
+                raise ValueError("method should be 'linear' or 'montecarlo'")
+            scalar = all(np.ndim(tor) == 0 for tor in tors)
+            tors = _broadcast_tors(*tors)
+            std = np.broadcast_to(np.asarray(std, dtype=float),
+                                  (len(tors[0]), 5))
+            if method == 'linear':
+                cs = interpolator(*tors, ef_corr=ef_corr, stats=self.stats)
+                grad = interpolator.gradient(*tors)
+                cs_std = np.sqrt(np.sum((grad * std[:, None, :2]) ** 2,
+                                        axis=2))
+                cs_std[np.isinf(cs)] = np.inf
+            else:
+                rng = np.random.RandomState(seed)
+                cs = np.empty((len(tors[0]), 2))
+                cs_std = np.empty((len(tors[0]), 2))
+                # bound the memory used by the samples
+                chunk_size = max(1, 2 ** 20 // n_samples)
+                for start in range(0, len(tors[0]), chunk_size):
+                    chunk = slice(start, start + chunk_size)
+                    samples = [tor[chunk, None] + std[chunk, k, None] *
+                               rng.standard_normal((len(tor[chunk]), n_samples))
+                               for k, tor in enumerate(tors)]
+                    samples = interpolator(*[sample.ravel() for sample in samples],
+                                           ef_corr=ef_corr)
+                    cs[chunk], cs_std[chunk] = _cloud_stats(
+                        samples.reshape(-1, n_samples, 2))
+        if self.stats is not None and sampled:
+            self.stats.time('interpolation', time.perf_counter() - start_time)
+            self.stats.count('queries', len(cs))
+            self.stats.count('outside', np.count_nonzero(np.isinf(cs[:, 0])))
+        if scalar:
+            return cs[0], cs_std[0]
+        return cs, cs_std
+
+    def interpolator(self, disaccharide):
+        """
+        Interpolator of the chemical shifts of a disaccharide.
+
+        The interpolator is built once for each disaccharide and can be
+        evaluated for arrays of conformations without any setup cost, see
+        `Interpolator`.
+
+        Parameters
+        ----------
+        disaccharide : string
+            disaccharides names used as keys in lt dictionary
+
+        Returns
+        ----------
+        interpolator : Interpolator
+        """
+        return self._interpolators[self.tables[disaccharide].key]
+
+    def compute_tors(self, disaccharide, cs0, cs1, ef_corr=183.4, eps=0.5,
+                     norm='box'):
         """
         Compute the torsional angles given the chemical shift of the
         carbons in the glycosidic bond
@@ -146,6 +459,11 @@ class CheSweet():
         eps: float
             chemical shift tolerance, increasing this value will, in general,
             increase the number of retrieved torsionals
+        norm : string
+            shape of the tolerance region, `box` (default) retrieves the
+            torsionals whose chemical shifts are both within `eps`, `euclidean`
+            retrieves the torsionals whose chemical shifts are at a euclidean
+            distance lower than `eps`
 
         Returns
         ----------
@@ -156,30 +474,744 @@ class CheSweet():
             If the chemical shifts are outside the zone of computed values
             the function returns an empty array
         """
-        # transform cs into shieldings
-        cs0 = ef_corr - cs0
-        cs1 = ef_corr - cs1
+        return self.compute_tors_many(disaccharide, [cs0], [cs1], ef_corr,
+                                      eps, norm)[0]
+
+    def compute_tors_many(self, disaccharide, cs0, cs1, ef_corr=183.4, eps=0.5,
+                          norm='box', return_index=False):
+        """
+        Compute the torsional angles compatible with many pairs of chemical
+        shifts at once, e.g. all the peaks of a HSQC spectrum.
+
+        The look-up table is searched using a 2D tree of the pre-calculated
+        shieldings, instead of comparing each pair with the whole table.
+
+        Parameters
+        ----------
+        dissacharide : string
+            name of the dissacharide involved
+        cs0, cs1 : array_like
+            chemical shifts of the first and second carbon on the glycosidic
+            bond, respectively
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+        eps: float
+            chemical shift tolerance, increasing this value will, in general,
+            increase the number of retrieved torsionals
+        norm : string
+            shape of the tolerance region, `box` (default) or `euclidean`.
+            See `compute_tors`
+        return_index : Boolean
+            whether to return the rows of the look-up table (True) instead of
+            the torsionals (False, default)
 
-        if not self.full:
-            disaccharide = disaccharide + '_red'
+        Returns
+        ----------
+        theoric_tors: list
+            one array for each pair of chemical shifts, with the torsionals
+            (or rows of `lt` if `return_index=True`) in the range of `eps`.
+            See `compute_tors`
+        """
+        if norm not in ('box', 'euclidean'):
+            raise ValueError("norm should be 'box' or 'euclidean'")
+        # transform cs into shieldings
+        cs0, cs1 = np.broadcast_arrays(ef_corr - np.asarray(cs0, dtype=float),
+                                       ef_corr - np.asarray(cs1, dtype=float))
+        cs0 = cs0.ravel()
+        cs1 = cs1.ravel()
 
+        info = self.tables[disaccharide]
+        disaccharide = info.key
         x = self.lt[disaccharide]
-        cond0 = (x[:,-2] < cs0 + eps) & (x[:,-2]  > cs0 - eps)
-        cond1 = (x[:,-1] < cs1 + eps) & (x[:,-1]  > cs1 - eps)
-        
-        if self.full:
-            if int(disaccharide.split('-')[4]) == 1:# bonds 1-1
-                theoric_tors = x[:,:4][cond0 & cond1]
-            else:# bonds different from 1-6
-                theoric_tors = x[:,:5][cond0 & cond1]
-        else:# reduced
-            if x.shape[1] == 4:# bonds different from 1-6
-                theoric_tors = x[:,:2][cond0 & cond1]
-            else:# 1-6 bonds
-                theoric_tors = x[:,:3][cond0 & cond1]
+        n_tors = len(info.columns)
+
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        # the tree returns a superset of the rows, that are then filtered
+        # with the exact (open) tolerance region
+        p = np.inf if norm == 'box' else 2
+        candidates = self._cs_tree[disaccharide].query_ball_point(
+            np.column_stack([cs0, cs1]), eps * (1 + 1e-9) + 1e-9, p=p)
+
+        theoric_tors = []
+        for i, rows in enumerate(candidates):
+            rows = np.sort(np.asarray(rows, dtype=int))
+            s = x[rows, -2:]
+            if norm == 'box':
+                cond0 = (s[:,0] < cs0[i] + eps) & (s[:,0]  > cs0[i] - eps)
+                cond1 = (s[:,1] < cs1[i] + eps) & (s[:,1]  > cs1[i] - eps)
+                rows = rows[cond0 & cond1]
+            else:
+                rows = rows[(s[:,0] - cs0[i]) ** 2 + (s[:,1] - cs1[i]) ** 2
+                            < eps ** 2]
+            if return_index:
+                theoric_tors.append(rows)
+            else:
+                theoric_tors.append(x[rows, :n_tors])
+        if stats is not None:
+            stats.time('tors_search', time.perf_counter() - start)
+            stats.count('tors_queries', len(cs0))
+            stats.count('tors_results', sum(len(t) for t in theoric_tors))
         return theoric_tors
 
 
+    def compute_tors_nearest(self, disaccharide, cs0, cs1, k=10,
+                             ef_corr=183.4, weights=None, return_index=False):
+        """
+        Retrieve the `k` conformations of the look-up table whose chemical
+        shifts are the nearest to the given ones, sorted by distance.
+
+        Parameters
+        ----------
+        dissacharide : string
+            name of the dissacharide involved
+        cs0, cs1 : float or array_like
+            chemical shift of the first and second carbon on the glycosidic
+            bond, respectively
+        k : int
+            number of conformations to retrieve. Default value is 10
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+        weights : tuple
+            weights of the first and second carbon in the distance, e.g. the
+            inverse of the experimental errors. If None (default) both carbons
+            have the same weight. The search trees of the last 8 ratios of
+            weights are kept
+        return_index : Boolean
+            whether to return the rows of the look-up table (True) instead of
+            the torsionals (False, default)
+
+        Returns
+        ----------
+        theoric_tors : array
+            torsionals (or rows of `lt` if `return_index=True`) of the nearest
+            conformations, with shape (k, n_tors), or (N, k, n_tors) when
+            `cs0` and `cs1` are arrays. If `full=True` the torsionals are
+            phi, psi and omega/chi's otherwise only phi and psi/omega.
+        dist : array
+            weighted euclidean distance between the given chemical shifts and
+            the chemical shifts of the nearest conformations, with shape (k,)
+            or (N, k)
+        """
+        scalar = np.ndim(cs0) == 0 and np.ndim(cs1) == 0
+        # transform cs into shieldings
+        cs0, cs1 = np.broadcast_arrays(ef_corr - np.asarray(cs0, dtype=float),
+                                       ef_corr - np.asarray(cs1, dtype=float))
+        query = np.column_stack([cs0.ravel(), cs1.ravel()])
+
+        info = self.tables[disaccharide]
+        disaccharide = info.key
+        x = self.lt[disaccharide]
+        k = min(k, len(x))
+        scale = 1.
+        if weights is None:
+            tree = self._cs_tree[disaccharide]
+        else:
+            # only the ratio of the weights changes the nearest conformations,
+            # trees are built with relative weights and distances rescaled
+            weights = np.asarray(weights, dtype=float)
+            scale = np.max(np.abs(weights)) or 1.
+            weights = weights / scale
+            key = (disaccharide, tuple(weights.ravel()))
+            if key in self._weighted_trees:
+                tree = self._weighted_trees[key]
+            else:
+                tree = cKDTree(x[:, -2:] * weights)
+                self._weighted_trees[key] = tree
+            query = query * weights
+        if self.stats is not None:
+            start = time.perf_counter()
+        dist, rows = tree.query(query, k=k)
+        if self.stats is not None:
+            self.stats.time('tors_search', time.perf_counter() - start)
+            self.stats.count('tors_queries', len(query))
+            self.stats.count('tors_results', rows.size)
+        dist = dist.reshape(len(query), k) * scale
+        rows = rows.reshape(len(query), k)
+
+        if return_index:
+            theoric_tors = rows
+        else:
+            theoric_tors = x[rows, :len(info.columns)]
+        if scalar:
+            return theoric_tors[0], dist[0]
+        return theoric_tors, dist
+
+    def compute_posterior(self, disaccharide, cs0, cs1, sigma=1., ef_corr=183.4,
+                          populations=None, log=False):
+        """
+        Probability of each phi/psi conformation of the look-up table given
+        observed chemical shifts.
+
+        Each conformation of the table is scored with a Gaussian error model
+        for the chemical shifts of both carbons. With the full look-up table
+        (or omega for reduced 1-6 tables) the probabilities are marginalized
+        over the chi rotamers. The result is normalized over the phi/psi grid,
+        with the phi and psi values of `tables[disaccharide].axes[:2]`, and is
+        0 for conformations not in the table.
+
+        Parameters
+        ----------
+        dissacharide : string
+            name of the dissacharide involved
+        cs0, cs1 : float or array_like
+            observed chemical shift of the first and second carbon on the
+            glycosidic bond, respectively
+        sigma : float or tuple
+            standard deviation of the errors of the chemical shifts, one value
+            for both carbons or one for each carbon. Default value is 1
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+        populations : array_like
+            prior populations of the chi rotamers, with shape
+            `grid.shape[2:5]`. If None (default) all rotamers have the same
+            prior
+        log : Boolean
+            whether to return the logarithm of the probabilities (True) or
+            the probabilities (False, default)
+
+        Returns
+        ----------
+        posterior : array
+            (phi, psi) grid of probabilities, or (N, phi, psi) when `cs0` and
+            `cs1` are arrays
+        """
+        scalar = np.ndim(cs0) == 0 and np.ndim(cs1) == 0
+        cs0, cs1 = np.broadcast_arrays(np.asarray(cs0, dtype=float),
+                                       np.asarray(cs1, dtype=float))
+        observed = np.column_stack([cs0.ravel(), cs1.ravel()])
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (2,))
+
+        grid = self.grid[self.tables[disaccharide].key]
+        n_phi, n_psi = grid.shape[:2]
+        # one column for each combination of chi rotamers
+        cs_grid = ef_corr - grid.reshape(n_phi, n_psi, -1, 2).astype(float)
+        with np.errstate(divide='ignore'):
+            if populations is None:
+                log_prior = np.zeros(cs_grid.shape[2])
+            else:
+                prior = np.broadcast_to(np.asarray(populations, dtype=float),
+                                        grid.shape[2:5]).ravel()
+                log_prior = np.log(prior / prior.sum())
+
+        # bound the memory used to about 8 MB per chunk
+        chunk_size = max(1, 2 ** 20 // cs_grid[..., 0].size)
+        posterior = np.empty((len(observed), n_phi, n_psi))
+        for start in range(0, len(observed), chunk_size):
+            chunk = observed[start:start + chunk_size, None, None, None, :]
+            loglik = -0.5 * np.sum(((cs_grid - chunk) / sigma) ** 2, axis=-1)
+            loglik = loglik + log_prior
+            # conformations not in the table
+            loglik[np.isnan(loglik)] = -np.inf
+            with np.errstate(divide='ignore', invalid='ignore'):
+                logp = _logsumexp(loglik, axis=3)
+                logp -= _logsumexp(logp, axis=(1, 2))[:, None, None]
+            posterior[start:start + chunk_size] = logp
+        if not log:
+            posterior = np.exp(posterior)
+        if scalar:
+            return posterior[0]
+        return posterior
+
+
+class Interpolator():
+    """
+    Interpolator of the chemical shifts of a disaccharide over the grid of
+    its look-up table.
+
+    Each cell of the 10 degree phi/psi grid is split into two triangles, as
+    in `compute_cs`, and the shieldings are interpolated linearly inside
+    them, angles are periodic so any value is wrapped into the interval
+    [-180, 180]. Conformations outside the zone of
+    computed values get `inf` and conformations at a border (less than four
+    computed corners) get the value of the nearest computed corner.
+
+    The chi angles are rounded to the nearest rotamer, as in `compute_cs`,
+    or, when rotamer populations are given, the chemical shifts of all the
+    rotamers are averaged with the populations as weights.
+
+    Parameters
+    ----------
+    grid : array
+        dense grid of shieldings, see `CheSweet.grid`
+    axes : list
+        values of the torsional angles along each axis of `grid`, see
+        `CheSweet.grid_axes`
+    diagonals : array
+        diagonal used to split each cell, see `_cell_diagonals`. If None
+        (default) cells are split along the diagonal from their lower to
+        their upper phi/psi corner
+    """
+
+    def __init__(self, grid, axes, diagonals=None):
+        self.grid = grid
+        self.axes = axes
+        if diagonals is None:
+            diagonals = np.ones((grid.shape[0] - 1, grid.shape[1] - 1) +
+                                grid.shape[2:5], dtype=bool)
+        self.diagonals = diagonals
+
+    def __call__(self, phi, psi, chi1=None, chi2=None, chi3=None,
+                 populations=None, ef_corr=183.4, stats=None):
+        """
+        Compute the chemical shifts of many conformations.
+
+        Parameters
+        ----------
+        phi : array_like
+            phi torsional angles in degrees
+        psi : array_like
+            psi torsional angles in degrees
+        chi1 : array_like
+            chi1 (or omega for reduced 1-6 bonds) torsional angles in degrees
+            (optional)
+        chi2 : array_like
+            chi2 torsional angles in degrees (optional)
+        chi3 : array_like
+            chi3 torsional angles in degrees (optional)
+        populations : array_like
+            populations of the chi rotamers, with shape `grid.shape[2:5]`
+            (one value for each combination of chi1, chi2 and chi3 in `axes`)
+            or (N,) + `grid.shape[2:5]` for a different population for each
+            conformation. Populations do not need to be normalized. If given,
+            the chi angles are not used (optional)
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+        stats : Stats
+            if given, timings and counters are recorded in it (optional)
+
+        Returns
+        ----------
+        cs : array
+            (N, 2) array with the interpolated chemical shifts of the first
+            and second carbon in the glycosidic bond for each conformation
+        """
+        if stats is not None:
+            start = time.perf_counter()
+        phi, psi, chi1, chi2, chi3 = _broadcast_tors(phi, psi, chi1, chi2, chi3)
+        i, x = _grid_cell(phi, self.axes[0])
+        j, y = _grid_cell(psi, self.axes[1])
+
+        if populations is None:
+            rotamer, chi_ok = _rotamer_index(self.axes, chi1, chi2, chi3)
+            shield, border = _interpolate_cells(self.grid, self.diagonals,
+                                                i, j, x, y, rotamer)
+            shield[~chi_ok] = np.nan
+            border &= chi_ok
+        else:
+            n_rotamers = self.grid.shape[2:5]
+            populations = np.broadcast_to(np.asarray(populations, dtype=float),
+                                          (len(phi),) + n_rotamers)
+            shield = np.zeros((len(phi), 2))
+            total = np.zeros(len(phi))
+            border = np.zeros(len(phi), dtype=bool)
+            for rotamer in np.ndindex(*n_rotamers):
+                weight = populations[(slice(None),) + rotamer]
+                if not np.any(weight):
+                    continue
+                shield_r, border_r = _interpolate_cells(
+                    self.grid, self.diagonals, i, j, x, y, rotamer)
+                # rotamers not computed for a conformation are not averaged
+                ok = ~np.isnan(shield_r[:, 0]) & (weight > 0)
+                shield[ok] += weight[ok, None] * shield_r[ok]
+                total[ok] += weight[ok]
+                # counted once, whatever the number of rotamers at a border
+                border |= border_r & ok
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shield /= total[:, None]
+
+        cs = ef_corr - shield
+        # we are outside the zone of computed values
+        outside = np.isnan(cs[:, 0])
+        cs[outside] = np.inf
+        if stats is not None:
+            stats.time('interpolation', time.perf_counter() - start)
+            stats.count('queries', len(cs))
+            stats.count('border', np.count_nonzero(border))
+            stats.count('outside', np.count_nonzero(outside))
+        return cs
+
+    def gradient(self, phi, psi, chi1=None, chi2=None, chi3=None):
+        """
+        Derivatives of the interpolated chemical shifts with respect to phi
+        and psi.
+
+        Inside each triangle these are the derivatives of the linear
+        interpolation, they are 0 at a border of the computed values (where
+        the nearest computed corner is used) and NaN outside them.
+
+        Parameters
+        ----------
+        phi, psi, chi1, chi2, chi3 : array_like
+            torsional angles in degrees, see `__call__`
+
+        Returns
+        ----------
+        grad : array
+            (N, 2, 2) array with the derivatives of the chemical shifts of
+            the first and second carbon (second axis) with respect to phi and
+            psi (last axis), in ppm per degree
+        """
+        phi, psi, chi1, chi2, chi3 = _broadcast_tors(phi, psi, chi1, chi2, chi3)
+        i, x = _grid_cell(phi, self.axes[0])
+        j, y = _grid_cell(psi, self.axes[1])
+        rotamer, chi_ok = _rotamer_index(self.axes, chi1, chi2, chi3)
+        _, _, grad = _interpolate_cells(self.grid, self.diagonals, i, j, x, y,
+                                        rotamer, gradient=True)
+        grad[~chi_ok] = np.nan
+        steps = np.array([self.axes[0][1] - self.axes[0][0],
+                          self.axes[1][1] - self.axes[1][0]])
+        # shieldings and chemical shifts change in opposite directions
+        return -grad / steps
+
+
+class Stats():
+    """
+    Timings and counters of CheSweet's computations.
+
+    Timings (in seconds) are accumulated for each phase of the computations:
+    `load` (reading the lookup tables), `rounding` (rounding the torsional
+    angles to the grid), `filter` (finding the neighbours in the lookup
+    table), `griddata` (interpolation in `compute_cs`), `interpolation`
+    (interpolation in `compute_cs_many`) and `tors_search` (searching the
+    lookup table in `compute_tors`).
+
+    Counters are `queries` (conformations computed), `border` (conformations
+    at a border of the computed values, interpolated as nearest neighbours),
+    `outside` (conformations outside the zone of computed values),
+    `tables_loaded`, `table_bytes`, `tors_queries` (pairs of chemical shifts
+    searched) and `tors_results` (conformations retrieved).
+
+    Parameters
+    ----------
+    callback : callable
+        if given, it is called as `callback(kind, name, value)` each time a
+        timing (kind `time`) or a counter (kind `count`) is recorded, e.g. to
+        export them to a metrics system
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """
+        Set all timings and counters to zero.
+        """
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def time(self, name, seconds):
+        """
+        Add `seconds` to the timing `name`.
+        """
+        self.timings[name] += seconds
+        if self.callback is not None:
+            self.callback('time', name, seconds)
+
+    def count(self, name, value=1):
+        """
+        Add `value` to the counter `name`.
+        """
+        self.counters[name] += int(value)
+        if self.callback is not None:
+            self.callback('count', name, int(value))
+
+    def as_dict(self):
+        """
+        Timings and counters as a dictionary.
+        """
+        return {'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+
+class TableInfo(namedtuple('TableInfo', ['name', 'key', 'full', 'donor',
+                                           'position', 'columns', 'axes',
+                                           'rotamers', 'n_rows',
+                                           'shielding_range'])):
+    """
+    Description of the look-up table of a disaccharide, built when the table
+    is loaded, see `CheSweet.tables`.
+
+    name : string
+        name of the disaccharide, e.g. a-D-Glcp-1-4-a-D-Glcp
+    key : string
+        name of the look-up table in `lt`, `grid` and `grid_axes`
+    full : Boolean
+        whether the table includes chi's torsional angles
+    donor, position : int
+        carbons of the first and second residue in the glycosidic bond, e.g.
+        1 and 4 for a 1-4 bond
+    columns : tuple
+        names of the torsional angles of the table, in the order of the
+        columns of `lt` and of the torsionals returned by `compute_tors`
+    axes : list
+        values of the torsional angles along each axis of the grid, see
+        `CheSweet.grid_axes`
+    rotamers : list
+        values of each chi (or omega) angle in the table
+    n_rows : int
+        number of conformations in the table
+    shielding_range : array
+        (2, 2) array with the minimum and maximum shielding of the first and
+        second carbon
+    """
+    __slots__ = ()
+
+    def cs_range(self, ef_corr=183.4):
+        """
+        (2, 2) array with the minimum and maximum chemical shift of the first
+        and second carbon in the table.
+        """
+        return ef_corr - self.shielding_range[:, ::-1]
+
+
+class CompactTable():
+    """
+    Look-up table of a disaccharide stored compactly.
+
+    The torsional angles only take a few values (multiples of 10 degrees for
+    phi and psi and the rotamers for the chi angles), so they are stored as
+    int8 indices into `values`. The shieldings are stored as float32, one
+    column after the other. Indexing a CompactTable returns the same float
+    array that indexing the original table would, e.g. `table[rows, -2:]`,
+    with the shieldings rounded to single precision.
+
+    Parameters
+    ----------
+    table : array
+        look-up table as read from the lut file
+    """
+
+    def __init__(self, table):
+        table = np.asarray(table)
+        angles = table[:, :-2]
+        self.values, indices = np.unique(angles, return_inverse=True)
+        if len(self.values) > 128:
+            raise ValueError('too many different angles for a compact table')
+        self.angles = indices.reshape(angles.shape).astype(np.int8)
+        self.shieldings = np.asfortranarray(table[:, -2:], dtype=np.float32)
+        self.shape = table.shape
+        self.ndim = 2
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.angles.nbytes + self.shieldings.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, columns = key[0], key[1:]
+        table = np.concatenate([self.values[self.angles[rows]],
+                                self.shieldings[rows]], axis=-1)
+        if columns:
+            return table[(Ellipsis,) + columns]
+        return table
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self[:]
+        return self[:].astype(dtype)
+
+
+class LutDirectory():
+    """
+    Look-up tables stored as text files in a folder, one file for each
+    table, named after the disaccharide (and ending with `_red` for
+    reduced tables), as in CheSweet's `lut` folder.
+
+    Backends only need two methods, `names` and `read`, any object with
+    them can be passed to CheSweet as `path`.
+
+    Parameters
+    ----------
+    folder : string
+        folder with the lut files
+    cache : Boolean or string
+        whether to keep a binary copy of the tables (True, default), the
+        folder used for the binary copies, or False, see `CheSweet`
+    """
+
+    def __init__(self, folder, cache=True):
+        self.folder = folder
+        if cache is True:
+            self.cache_dir = _default_cache_dir(folder)
+        elif cache:
+            self.cache_dir = cache
+        else:
+            self.cache_dir = None
+
+    def names(self):
+        """
+        Names of the tables.
+        """
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(name for name in os.listdir(self.folder)
+                      if not name.startswith('.') and
+                      os.path.isfile(join(self.folder, name)))
+
+    def read(self, name, n_cols):
+        """
+        Read the table `name`, an array with `n_cols` columns.
+        """
+        return _read_table(join(self.folder, name), n_cols, self.cache_dir)
+
+
+class PackedLut():
+    """
+    Look-up tables packed in a single `.npz` file, see `pack_lut`.
+
+    The file holds one array for each table, full and reduced, and a
+    `__metadata__` entry with the format version and the name and shape of
+    each table, so loading CheSweet opens a single file instead of parsing
+    one text file for each table.
+
+    Parameters
+    ----------
+    fname : string
+        path to the packed file
+    """
+    version = 1
+
+    def __init__(self, fname):
+        self.fname = fname
+        # the file is only kept open while reading from it
+        with np.load(fname) as data:
+            if '__metadata__' not in data:
+                raise ValueError('{} is not a packed look-up table'.format(fname))
+            self.metadata = json.loads(str(data['__metadata__']))
+        if self.metadata.get('format') != 'chesweet-lut':
+            raise ValueError('{} is not a packed look-up table'.format(fname))
+        if self.metadata['version'] > self.version:
+            raise ValueError('{} was packed with a newer version of CheSweet '
+                             '(format version {})'.format(
+                                 fname, self.metadata['version']))
+
+    def names(self):
+        """
+        Names of the tables.
+        """
+        return sorted(self.metadata['tables'])
+
+    def read(self, name, n_cols):
+        """
+        Read the table `name`, an array with `n_cols` columns.
+        """
+        with np.load(self.fname) as data:
+            table = data[name]
+        if table.ndim != 2 or table.shape[1] != n_cols:
+            raise ValueError('table {} should have {} columns'.format(name,
+                                                                       n_cols))
+        return table
+
+
+def pack_lut(fname, path=None, compress=False):
+    """
+    Pack all the look-up tables (full and reduced) of a folder in a single
+    `.npz` file, that can be used as `path` of CheSweet.
+
+    Parameters
+    ----------
+    fname : string
+        name of the packed file, `.npz` is appended if missing
+    path : string
+        folder of lookup table, as in CheSweet. If None (default) CheSweet's
+        lookup table will be used
+    compress : Boolean
+        whether to compress the tables (True) or not (False, default).
+        Compressed files are smaller but slower to load
+
+    Returns
+    ----------
+    fname : string
+        name of the packed file
+    """
+    if path is None:
+        folder = pkg.resource_filename(__name__, '/'.join(['lut']))
+    else:
+        folder = '/'.join([path, 'lut'])
+    backend = LutDirectory(folder, cache=False)
+    tables = {name: backend.read(name, _n_cols(name))
+              for name in backend.names()}
+    if not tables:
+        raise ValueError('I could not find look-up tables in {}'.format(folder))
+    metadata = {'format': 'chesweet-lut', 'version': PackedLut.version,
+                'tables': {name: list(table.shape)
+                           for name, table in tables.items()}}
+    if not fname.endswith('.npz'):
+        fname += '.npz'
+    save = np.savez_compressed if compress else np.savez
+    save(fname, __metadata__=np.array(json.dumps(metadata)), **tables)
+    return fname
+
+
+class CellCache():
+    """
+    Least recently used cache of the interpolators of the grid cells used by
+    `CheSweet.compute_cs`.
+
+    Keys are (disaccharide, phi cell, psi cell, chi rotamers) and values
+    are the number of computed corners of the cell and the interpolator
+    built from them (the triangulation and the shieldings of the corners,
+    or None outside the zone of computed values).
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of cells kept, when full the least recently used cell
+        is discarded
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._cells = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        if key in self._cells:
+            self.hits += 1
+            self._cells.move_to_end(key)
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__(self, key):
+        return self._cells[key]
+
+    def __setitem__(self, key, value):
+        self._cells[key] = value
+        self._cells.move_to_end(key)
+        while len(self._cells) > self.maxsize:
+            self._cells.popitem(last=False)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def clear(self):
+        """
+        Discard all the cells and set the hits and misses to zero.
+        """
+        self._cells.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """
+        Hits, misses, current size and maximum size of the cache.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._cells), 'maxsize': self.maxsize}
+
+
 def _load(self):
     """
     Load CheSweet's look-up table as a dictionary of arrays.
@@ -190,27 +1222,461 @@ def _load(self):
         keys are the names of the dissacharides and values are arrays
         with the last two columns being the chemical shift pre-calculated 
         and the rest being torsinal angles. The number of columns in
-        the arrays depends on wheter `full` is True or False
+        the arrays depends on wheter `full` is True or False. The arrays
+        are read the first time they are requested
     """
-    lut = {}
-    if self.full:
-        for disaccharide in self.disaccharides:
-            lut[bn(disaccharide)] = np.fromfile(disaccharide, sep=' ').reshape(-1, 8)
-    else:
-        for disaccharide in self.disaccharides:
-            # Disaccharides with 1-6 glycosidic bond
-            if '-1-6-' in disaccharide:
-                lut[bn(disaccharide)] = np.fromfile(disaccharide, sep=' ').reshape(-1, 5)
-            # Disaccharides with glycosidic bond different from 1-6
-            else:
-                lut[bn(disaccharide)] = np.fromfile(disaccharide, sep=' ').reshape(-1, 4)
+    def load(name):
+        start = time.perf_counter()
+        table = self.backend.read(name, _n_cols(name))
+        if self.compact:
+            table = CompactTable(table)
+        if self.stats is not None:
+            self.stats.time('load', time.perf_counter() - start)
+            self.stats.count('tables_loaded')
+            self.stats.count('table_bytes', table.nbytes)
+        return table
 
-    if lut:
-        return lut
+    if self.disaccharides:
+        return _LazyDict(self.disaccharides, load)
     else:
         raise ValueError('I could not build a look-up table')
 
 
+class _LazyDict(Mapping):
+    """
+    Read-only dictionary whose values are computed the first time they are
+    requested.
+
+    Parameters
+    ----------
+    keys : iterable
+        keys of the dictionary
+    load : callable
+        function that takes a key and returns its value
+    """
+
+    def __init__(self, keys, load):
+        self._keys = list(keys)
+        self._load = load
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._values[key] = self._load(key)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def loaded(self):
+        """
+        Keys whose value has already been computed.
+        """
+        return list(self._values)
+
+
+def _parse_name(name):
+    """
+    Split the name of a lut file.
+
+    Parameters
+    ----------
+    name : string
+        name of a lut file, e.g. a-D-Glcp-1-4-a-D-Glcp_red
+
+    Returns
+    ----------
+    name : string
+        name of the disaccharide, without the `_red` suffix
+    donor, position : int
+        carbons of the first and second residue in the glycosidic bond
+    """
+    if name.endswith('_red'):
+        name = name[:-4]
+    fields = name.split('-')
+    return name, int(fields[3]), int(fields[4])
+
+
+def _n_cols(name):
+    """
+    Number of columns of the lut file `name`.
+    """
+    if not name.endswith('_red'):
+        return 8
+    # Disaccharides with 1-6 glycosidic bond
+    elif _parse_name(name)[2] == 6:
+        return 5
+    # Disaccharides with glycosidic bond different from 1-6
+    else:
+        return 4
+
+
+def _read_table(fname, n_cols, cache_dir=None):
+    """
+    Read a look-up table file.
+
+    When `cache_dir` is not None the table is read from a binary copy in
+    that folder, memory mapped so processes loading the same table share
+    it. The copy is rebuilt from the text file when it is missing or the
+    modification time or size of the text file changed.
+
+    Parameters
+    ----------
+    fname : string
+        path to the look-up table file
+    n_cols : int
+        number of columns of the look-up table
+    cache_dir : string
+        folder for the binary copies of the look-up tables (optional)
+
+    Returns
+    ----------
+    table : array
+        look-up table of shape (rows, n_cols)
+    """
+    if cache_dir is None:
+        return np.fromfile(fname, sep=' ').reshape(-1, n_cols)
+
+    stat = os.stat(fname)
+    cached = join(cache_dir, '{}-{}-{}.npy'.format(bn(fname), stat.st_mtime_ns,
+                                                   stat.st_size))
+    try:
+        table = np.load(cached, mmap_mode='r')
+        if table.ndim == 2 and table.shape[1] == n_cols:
+            return table
+    except (OSError, ValueError):
+        pass
+
+    table = np.fromfile(fname, sep=' ').reshape(-1, n_cols)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # remove copies of older versions of the table
+        for old in glob.glob(join(cache_dir, '{}-*.npy'.format(bn(fname)))):
+            os.remove(old)
+        tmp = '{}.{}.tmp'.format(cached, os.getpid())
+        with open(tmp, 'wb') as fh:
+            np.save(fh, table)
+        os.replace(tmp, cached)
+        return np.load(cached, mmap_mode='r')
+    # we can not write in the cache folder, use the text file
+    except OSError:
+        return table
+
+
+def _default_cache_dir(files):
+    """
+    Folder used to store the binary copy of the look-up tables in `files`.
+    """
+    base = os.environ.get('XDG_CACHE_HOME',
+                          join(os.path.expanduser('~'), '.cache'))
+    key = hashlib.sha1(os.path.abspath(files).encode()).hexdigest()[:16]
+    return join(base, 'chesweet', key)
+
+
+def _grid_axes(table, full):
+    """
+    Values of the torsional angles along each axis of the grid of a look-up
+    table.
+
+    Parameters
+    ----------
+    table : array
+        look-up table of a disaccharide, as returned by `_load`
+    full : Boolean
+        whether the table includes the chi's torsional angles or not
+
+    Returns
+    ----------
+    axes : list
+        arrays with the values of phi, psi and the chi's angles present in the
+        table
+    """
+    if full:
+        n_tors = 5
+    else:
+        n_tors = table.shape[1] - 2
+    # phi and psi angles in lt are compute using a 10 degree grid.
+    axes = [np.arange(-180., 181., 10.), np.arange(-180., 181., 10.)]
+    axes += [np.unique(table[:, col]) for col in range(2, n_tors)]
+    return axes
+
+
+def _build_grid(table, axes, dtype=np.int32):
+    """
+    Index the rows of a look-up table on a dense grid of torsional angles.
+
+    Parameters
+    ----------
+    table : array
+        look-up table of a disaccharide, as returned by `_load`
+    axes : list
+        values of the torsional angles along each axis of the grid, as
+        returned by `_grid_axes`
+    dtype : dtype
+        integer type of the rows, it must hold the number of rows of `table`
+
+    Returns
+    ----------
+    rows : array
+        integer array of shape (phi, psi, chi1, chi2, chi3) with the row of
+        `table` computed for each conformation, or -1 for conformations not
+        present in the table. Axes without a torsional column in the table
+        have length 1
+    """
+    n_tors = len(axes)
+    indices = [np.searchsorted(axis, table[:, col])
+               for col, axis in enumerate(axes)]
+    indices += [np.zeros(len(table), dtype=int)] * (5 - n_tors)
+    shape = [len(axis) for axis in axes] + [1] * (5 - n_tors)
+    rows = np.full(shape, -1, dtype=dtype)
+    rows[tuple(indices)] = np.arange(len(table))
+    return rows
+
+
+def _grid_shieldings(table, rows, dtype=float):
+    """
+    Dense grid of shieldings, with a trailing axis for the first and second
+    carbon in the glycosidic bond. Conformations not present in the table
+    are NaN.
+    """
+    grid = table[rows, -2:].astype(dtype)
+    grid[rows < 0] = np.nan
+    return grid
+
+
+def _cell_diagonals(rows):
+    """
+    Diagonal used to split each phi/psi cell of a grid into two triangles.
+
+    `compute_cs` triangulates the four corners of a cell in the order of the
+    look-up table, and the Delaunay triangulation of a square splits it
+    along the diagonal through the corner that comes last.
+
+    Parameters
+    ----------
+    rows : array
+        rows of the look-up table at each node of the grid, as returned by
+        `_build_grid`
+
+    Returns
+    ----------
+    diagonals : array
+        boolean array of shape (phi - 1, psi - 1, chi1, chi2, chi3), True
+        for cells split along the diagonal from the lower to the upper
+        phi/psi corner and False for cells split along the other one
+    """
+    corners = np.stack([rows[:-1, :-1], rows[:-1, 1:],
+                        rows[1:, :-1], rows[1:, 1:]])
+    last = np.argmax(corners, axis=0)
+    return (last == 0) | (last == 3)
+
+
+def _interpolate_cells(grid, diagonals, i, j, x, y, rotamer, gradient=False):
+    """
+    Interpolate the shieldings of a grid inside the phi/psi cells.
+
+    Each cell is split into two triangles along one of its diagonals and
+    the shieldings are interpolated linearly inside the triangle that
+    contains each conformation, as `LinearNDInterpolator` does in
+    `compute_cs`.
+
+    Parameters
+    ----------
+    grid : array
+        dense grid of shieldings, see `CheSweet.grid`
+    diagonals : array
+        diagonal used to split each cell, see `_cell_diagonals`
+    i, j : array
+        indices of the lower phi and psi nodes of the cells, see `_grid_cell`
+    x, y : array
+        position of the angles inside the phi and psi cells, NaN for angles
+        not defined, which are outside the zone of computed values
+    rotamer : tuple
+        indices of the chi1, chi2 and chi3 rotamers, integers or arrays
+    gradient : Boolean
+        whether to return the derivatives of the shieldings with respect to
+        x and y too
+
+    Returns
+    ----------
+    shield : array
+        (N, 2) array of interpolated shieldings, NaN outside the zone of
+        computed values
+    border : array
+        whether each conformation is at a border of the computed values
+    grad : array
+        (N, 2, 2) array with the derivatives of the shieldings with respect
+        to x and y (last axis), 0 at borders and NaN outside the zone of
+        computed values. Only if `gradient=True`
+    """
+    k1, k2, k3 = rotamer
+    corners = np.stack([grid[i, j, k1, k2, k3],
+                        grid[i, j + 1, k1, k2, k3],
+                        grid[i + 1, j, k1, k2, k3],
+                        grid[i + 1, j + 1, k1, k2, k3]], axis=1)
+    computed = ~np.isnan(corners[:, :, 0])
+    computed[np.isnan(x) | np.isnan(y)] = False
+    n_computed = computed.sum(axis=1)
+
+    shield = np.full((len(i), 2), np.nan)
+    # life is sweet!
+    inside = n_computed == 4
+    xi, yi = x[inside], y[inside]
+    main = np.broadcast_to(diagonals[i, j, k1, k2, k3], i.shape)[inside]
+    # barycentric weights of the corners in the triangles (0, 2, 3) and
+    # (0, 1, 3) of the main diagonal or (0, 1, 2) and (1, 2, 3) of the other
+    lower = np.where(main, xi >= yi, xi + yi <= 1)
+    weights = np.empty((len(xi), 4))
+    weights[:, 0] = np.where(main, np.where(lower, 1 - xi, 1 - yi),
+                             np.where(lower, 1 - xi - yi, 0))
+    weights[:, 1] = np.where(main, np.where(lower, 0, yi - xi),
+                             np.where(lower, yi, 1 - xi))
+    weights[:, 2] = np.where(main, np.where(lower, xi - yi, 0),
+                             np.where(lower, xi, 1 - yi))
+    weights[:, 3] = np.where(main, np.where(lower, yi, xi),
+                             np.where(lower, 0, xi + yi - 1))
+    shield[inside] = np.einsum('nk,nkc->nc', weights, corners[inside])
+    # we hit a border of the computed values!
+    border = (n_computed > 0) & (n_computed < 4)
+    if np.any(border):
+        dist = np.stack([x ** 2 + y ** 2, x ** 2 + (1 - y) ** 2,
+                         (1 - x) ** 2 + y ** 2, (1 - x) ** 2 + (1 - y) ** 2],
+                        axis=1)
+        dist[~computed] = np.inf
+        nearest = np.argmin(dist[border], axis=1)
+        shield[border] = corners[border][np.arange(len(nearest)), nearest]
+    if not gradient:
+        return shield, border
+
+    grad = np.zeros((len(i), 2, 2))
+    grad[n_computed == 0] = np.nan
+    c = corners[inside]
+    lower, main = lower[:, None], main[:, None]
+    grad[inside, :, 0] = np.where(lower, c[:, 2] - c[:, 0], c[:, 3] - c[:, 1])
+    grad[inside, :, 1] = np.where(main == lower, c[:, 3] - c[:, 2],
+                                  c[:, 1] - c[:, 0])
+    return shield, border, grad
+
+
+def _logsumexp(a, axis):
+    """
+    Logarithm of the sum of the exponentials of `a` along `axis`, -inf when
+    all the values are -inf.
+    """
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max[~np.isfinite(a_max)] = 0
+    out = np.log(np.sum(np.exp(a - a_max), axis=axis, keepdims=True)) + a_max
+    return np.squeeze(out, axis=axis)
+
+
+def _cloud_stats(cs):
+    """
+    Mean and standard deviation of clouds of chemical shifts, with shape
+    (N, n_samples, 2), without the samples outside the zone of computed
+    values. Clouds without samples inside it get `inf`.
+    """
+    inside = np.isfinite(cs)
+    n_inside = inside.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(inside, cs, 0).sum(axis=1) / n_inside
+        var = np.where(inside, (cs - mean[:, None]) ** 2, 0).sum(axis=1) / n_inside
+    mean[n_inside == 0] = np.inf
+    var[n_inside == 0] = np.inf
+    return mean, np.sqrt(var)
+
+
+def _broadcast_tors(phi, psi, chi1=None, chi2=None, chi3=None):
+    """
+    Broadcast torsional angles to 1D arrays of the same length.
+
+    Missing chi angles are replaced by NaN.
+    """
+    tors = [np.nan if tor is None else tor
+            for tor in (phi, psi, chi1, chi2, chi3)]
+    tors = np.broadcast_arrays(*[np.asarray(tor, dtype=float) for tor in tors])
+    return [np.ravel(tor) for tor in tors]
+
+
+def _grid_cell(tor, axis):
+    """
+    Find the cell of a regular grid that contains each angle.
+
+    Parameters
+    ----------
+    tor : array
+        angles in degrees, they can be outside the interval [-180, 180]
+    axis : array
+        values of the angles at the nodes of the grid
+
+    Returns
+    ----------
+    idx : array
+        index of the lower node of the cell, the upper one is `idx + 1`
+    frac : array
+        position of the angle inside the cell, from 0 (lower node) to 1
+        (upper node). Angles not defined (NaN) get index 0 and NaN, see
+        `_interpolate_cells`
+    """
+    outside = (tor > 180.) | (tor < -180.)
+    if np.any(outside):
+        tor_rad = np.radians(tor[outside])
+        tor = tor.copy()
+        tor[outside] = np.degrees(np.arctan2(np.sin(tor_rad), np.cos(tor_rad)))
+    step = axis[1] - axis[0]
+    undefined = np.isnan(tor)
+    idx = np.floor((np.where(undefined, axis[0], tor) - axis[0]) / step)
+    idx = np.clip(idx.astype(int), 0, len(axis) - 2)
+    frac = (tor - axis[idx]) / step
+    return idx, frac
+
+
+def _rotamer_index(axes, chi1, chi2, chi3):
+    """
+    Indices of the chi rotamers of the grid for each conformation.
+
+    Returns
+    ----------
+    rotamer : list
+        indices of the chi1, chi2 and chi3 rotamers, 0 for chi angles without
+        a column in the look-up table
+    chi_ok : array
+        whether the chi angles of each conformation are in the table
+    """
+    # chi angles without a column in the look-up table are ignored
+    chi_idx = [_chi_index(axis, chi)
+               for axis, chi in zip(axes[2:], [chi1, chi2, chi3])]
+    chi_idx += [np.zeros(len(chi1), dtype=int)] * (3 - len(chi_idx))
+    chi_ok = np.all([idx >= 0 for idx in chi_idx], axis=0)
+    rotamer = [np.where(chi_ok, idx, 0) for idx in chi_idx]
+    return rotamer, chi_ok
+
+
+def _chi_index(axis, chi):
+    """
+    Index of the nearest chi rotamer of each angle along a grid axis.
+
+    Missing angles (NaN) take the placeholder value (0) used in the look-up
+    tables for torsionals that are not defined, as in `compute_cs`. Angles
+    whose rotamer is not in the look-up table get -1.
+    """
+    chi_rotamers = np.array([-180., -60.,  60., 180.])
+    missing = np.isnan(chi)
+    nearest = chi_rotamers[np.argmin(np.abs(chi_rotamers -
+                                            np.where(missing, 0., chi)[:, None]),
+                                     axis=1)]
+    nearest = np.where(missing, 0., nearest)
+    idx = np.clip(np.searchsorted(axis, nearest), 0, len(axis) - 1)
+    return np.where(axis[idx] == nearest, idx, -1)
+
+
 def _round_down_up(tor, step=10.):
     """
     Round tor down and up to multiples of step.
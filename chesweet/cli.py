@@ -0,0 +1,250 @@
+"""
+Command line interface of CheSweet.
+
+    chesweet cs DISACCHARIDE [INPUT] [-o OUTPUT]
+    chesweet tors DISACCHARIDE [INPUT] [-o OUTPUT]
+    chesweet serve [--host HOST] [--port PORT]
+    chesweet pack OUTPUT [--path PATH]
+
+Input is read from stdin (default), a text/CSV file or a `.npy` file, and
+processed in chunks so files of any size can be computed in constant memory.
+`serve` starts a HTTP/JSON server, see `chesweet.service.serve`, and `pack`
+packs a folder of lut files in a single file, see `chesweet.pack_lut`.
+"""
+import argparse
+import sys
+import numpy as np
+from .chesweet import CheSweet, pack_lut
+from .parallel import ParallelCheSweet
+from .service import run_server
+
+
+def main(argv=None):
+    """
+    Entry point of the `chesweet` command.
+    """
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.command == 'pack':
+        pack_lut(args.output, args.path, args.compress)
+        return 0
+
+    if args.command == 'serve':
+        if args.processes is None:
+            chesweet = CheSweet(path=args.path, full=args.full)
+            chesweet.preload()
+        else:
+            chesweet = ParallelCheSweet(path=args.path, full=args.full,
+                                        processes=args.processes)
+        try:
+            run_server(chesweet, args.host, args.port, delay=args.delay)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.processes is not None:
+                chesweet.close()
+        return 0
+
+    chesweet = CheSweet(path=args.path, full=args.full)
+    if args.disaccharide not in chesweet.tables:
+        parser.error('unknown disaccharide {}, use one of: {}'.format(
+            args.disaccharide, ', '.join(sorted(chesweet.tables))))
+    if args.command == 'cs':
+        columns = chesweet.tables[args.disaccharide].columns
+    else:
+        columns = ('cs0', 'cs1')
+    chunks = _read_chunks(args.input, args.chunk_size, args.skiprows)
+    chunks = _check_columns(chunks, columns, args.disaccharide, parser)
+    if args.command == 'cs':
+        results = _compute_cs(chesweet, args, chunks)
+    else:
+        results = _compute_tors(chesweet, args, chunks)
+
+    if args.output is not None and args.output.endswith('.npy'):
+        if args.command != 'cs' or not args.input.endswith('.npy'):
+            parser.error('.npy output is only available for cs with .npy input')
+        n_rows = len(np.load(args.input, mmap_mode='r'))
+        out = np.lib.format.open_memmap(args.output, mode='w+',
+                                        shape=(n_rows, 2))
+        start = 0
+        for result in results:
+            out[start:start + len(result)] = result
+            start += len(result)
+        out.flush()
+        return 0
+
+    delimiter = args.delimiter
+    if delimiter is None:
+        names = [args.input, args.output]
+        delimiter = ',' if any(name and name.endswith('.csv')
+                               for name in names) else ' '
+    # tors output starts with the number of the input row
+    index = args.command == 'tors'
+    if args.output is None or args.output == '-':
+        _write(results, sys.stdout, delimiter, index)
+    else:
+        with open(args.output, 'w') as fh:
+            _write(results, fh, delimiter, index)
+    return 0
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='chesweet',
+        description='Chemical shifts for glycans')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    cs = subparsers.add_parser(
+        'cs', help='compute chemical shifts from torsional angles',
+        description='Compute the chemical shifts of C1 and Cx from rows of '
+                    'torsional angles: phi psi [chi1 chi2 chi3]. For reduced '
+                    'look-up tables of 1-6 bonds the third column is omega.')
+    tors = subparsers.add_parser(
+        'tors', help='compute torsional angles from chemical shifts',
+        description='Retrieve the torsional angles compatible with rows of '
+                    'chemical shifts: cs0 cs1. Each output row starts with '
+                    'the number of the input row.')
+    for sub in (cs, tors):
+        sub.add_argument('disaccharide', help='name of the disaccharide, '
+                         'e.g. a-D-Glcp-1-4-a-D-Glcp')
+        sub.add_argument('input', nargs='?', default='-',
+                         help='text, CSV or .npy file, - (default) for stdin')
+        sub.add_argument('-o', '--output', default=None,
+                         help='output file, stdout by default. For cs a .npy '
+                              'file can be used with .npy input')
+        sub.add_argument('--full', action='store_true',
+                         help="include chi's torsional angles")
+        sub.add_argument('--path', default=None,
+                         help='folder of the lookup table or packed .npz file')
+        sub.add_argument('--ef-corr', type=float, default=183.4,
+                         help='correction used to turn shieldings into '
+                              'chemical shifts (default 183.4)')
+        sub.add_argument('--chunk-size', type=int, default=100000,
+                         help='number of rows computed at once')
+        sub.add_argument('--skiprows', type=int, default=0,
+                         help='number of header lines of text input')
+        sub.add_argument('-d', '--delimiter', default=None,
+                         help='delimiter of the text output, a comma for CSV '
+                              'files and a space otherwise')
+    tors.add_argument('--eps', type=float, default=0.5,
+                      help='chemical shift tolerance (default 0.5)')
+    tors.add_argument('--norm', choices=['box', 'euclidean'], default='box',
+                      help='shape of the tolerance region (default box)')
+    tors.add_argument('-k', '--nearest', type=int, default=None,
+                      help='retrieve the k nearest conformations instead of '
+                           'using a tolerance, the distance is written after '
+                           'the row number')
+
+    serve = subparsers.add_parser(
+        'serve', help='serve chemical shifts and torsional angles over HTTP',
+        description='Start a HTTP server, POST JSON objects to /cs (with '
+                    'disaccharide, phi, psi [chi1 chi2 chi3]) or to /tors (with '
+                    'disaccharide, cs0, cs1 [eps norm]). Concurrent requests '
+                    'are computed together.')
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='address to listen on (default 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8000,
+                       help='port to listen on (default 8000)')
+    serve.add_argument('--full', action='store_true',
+                       help="include chi's torsional angles")
+    serve.add_argument('--path', default=None,
+                       help='folder of the lookup table or packed .npz file')
+    serve.add_argument('--delay', type=float, default=0.002,
+                       help='seconds to wait for concurrent requests before '
+                            'computing them together (default 0.002)')
+    serve.add_argument('--processes', type=int, default=None,
+                       help='split each batch between this number of processes')
+
+    pack = subparsers.add_parser(
+        'pack', help='pack the lookup tables in a single file',
+        description='Pack all the lut files (full and reduced) of a lookup '
+                    'table folder in a single .npz file, that can be used as '
+                    '--path.')
+    pack.add_argument('output', help='name of the packed .npz file')
+    pack.add_argument('--path', default=None,
+                      help="folder of the lookup table, CheSweet's by default")
+    pack.add_argument('--compress', action='store_true',
+                      help='compress the tables, smaller but slower to load')
+    return parser
+
+
+def _read_chunks(fname, chunk_size, skiprows=0):
+    """
+    Read rows of numbers in chunks, from stdin (`-`), a text/CSV file or a
+    `.npy` file.
+    """
+    if fname.endswith('.npy'):
+        data = np.load(fname, mmap_mode='r')
+        for start in range(0, len(data), chunk_size):
+            yield np.array(data[start:start + chunk_size], dtype=float, ndmin=2)
+        return
+
+    fh = sys.stdin if fname == '-' else open(fname)
+    try:
+        for _ in range(skiprows):
+            fh.readline()
+        lines = []
+        for line in fh:
+            line = line.split('#')[0].replace(',', ' ').strip()
+            if line:
+                lines.append(line)
+            if len(lines) == chunk_size:
+                yield np.loadtxt(lines, ndmin=2)
+                lines = []
+        if lines:
+            yield np.loadtxt(lines, ndmin=2)
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def _check_columns(chunks, columns, disaccharide, parser):
+    """
+    Stop with an error if the rows do not have one value for each column.
+    """
+    for chunk in chunks:
+        if chunk.shape[1] != len(columns):
+            parser.error('{} needs {} columns ({}), the input has {}'.format(
+                disaccharide, len(columns), ' '.join(columns), chunk.shape[1]))
+        yield chunk
+
+
+def _compute_cs(chesweet, args, chunks):
+    for tors in chunks:
+        yield chesweet.compute_cs_many(args.disaccharide, *tors.T,
+                                       ef_corr=args.ef_corr)
+
+
+def _compute_tors(chesweet, args, chunks):
+    start = 0
+    for cs in chunks:
+        if args.nearest is not None:
+            tors, dist = chesweet.compute_tors_nearest(
+                args.disaccharide, cs[:, 0], cs[:, 1], k=args.nearest,
+                ef_corr=args.ef_corr)
+            rows = np.repeat(np.arange(start, start + len(cs)), tors.shape[1])
+            yield np.column_stack([rows, dist.ravel(),
+                                   tors.reshape(-1, tors.shape[-1])])
+        else:
+            tors = chesweet.compute_tors_many(args.disaccharide, cs[:, 0],
+                                              cs[:, 1], ef_corr=args.ef_corr,
+                                              eps=args.eps, norm=args.norm)
+            rows = np.repeat(np.arange(start, start + len(cs)),
+                             [len(t) for t in tors])
+            yield np.column_stack([rows, np.concatenate(tors)])
+        start += len(cs)
+
+
+def _write(results, fh, delimiter, index=False):
+    for result in results:
+        if index:
+            fmt = ['%d'] + ['%.6g'] * (result.shape[1] - 1)
+        else:
+            fmt = '%.6f'
+        np.savetxt(fh, result, fmt=fmt, delimiter=delimiter)
+        fh.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""
+Population weighted averages of chemical shifts over ensembles, computed on
+the fly, and fitting of ensemble populations to experimental chemical shifts.
+"""
+import numpy as np
+from scipy.optimize import minimize, nnls
+from scipy.special import logsumexp
+
+
+class EnsembleAverage():
+    """
+    Running population weighted mean and variance of the chemical shifts of
+    one or more glycosidic bonds.
+
+    Conformations are added in chunks, e.g. the frames of a trajectory as they
+    are read, and only the accumulated weight, mean and sum of squared
+    deviations of each bond are kept, so memory use does not depend on the
+    size of the ensemble. Chunks are combined using the pairwise update of
+    Chan et al. (a chunked, weighted form of Welford's algorithm).
+
+    Conformations outside the zone of computed values (chemical shift `inf`)
+    are not included in the averages, they are counted separately, see
+    `n_outside` and `outside_weight`.
+
+    Averages computed by different processes can be combined with `merge`.
+    EnsembleAverage objects can be pickled, the CheSweet instance is not
+    included, so they can be sent back from worker processes.
+    """
+
+    def __init__(self, chesweet=None, ef_corr=183.4):
+        """
+        Parameters
+        ----------
+        chesweet : CheSweet
+            CheSweet instance used to compute the chemical shifts. Only
+            needed to add torsional angles (`add` and `add_glycan`)
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+        """
+        self.chesweet = chesweet
+        self.ef_corr = ef_corr
+        self._moments = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['chesweet'] = None
+        return state
+
+    @property
+    def linkages(self):
+        """
+        Names of the glycosidic bonds added, in the order they were added.
+        """
+        return list(self._moments)
+
+    def add(self, disaccharide, phi, psi, chi1=None, chi2=None, chi3=None,
+            weights=None, linkage=None):
+        """
+        Add conformations of a glycosidic bond given their torsional angles.
+
+        Parameters
+        ----------
+        disaccharide : string
+            name of the disaccharide
+        phi, psi, chi1, chi2, chi3 : array
+            torsional angles in degrees, as in `CheSweet.compute_cs_many`
+        weights : array
+            population of each conformation, if None (default) all
+            conformations have the same weight
+        linkage : hashable
+            name of the glycosidic bond, by default the name of the
+            disaccharide. Use it to average bonds of the same kind
+            separately, e.g. the bonds of a glycan
+        """
+        if self.chesweet is None:
+            raise ValueError('a CheSweet instance is needed to add torsionals')
+        cs = self.chesweet.compute_cs_many(disaccharide, phi, psi, chi1, chi2,
+                                           chi3, ef_corr=self.ef_corr)
+        if linkage is None:
+            linkage = disaccharide
+        self.add_cs(linkage, cs, weights)
+
+    def add_cs(self, linkage, cs, weights=None):
+        """
+        Add the chemical shifts of conformations of a glycosidic bond.
+
+        Parameters
+        ----------
+        linkage : hashable
+            name of the glycosidic bond
+        cs : array
+            (N, 2) array with the chemical shifts of the first and second
+            carbon of the bond, `inf` for conformations outside the zone of
+            computed values
+        weights : array
+            population of each conformation, if None (default) all
+            conformations have the same weight
+        """
+        cs = np.asarray(cs, dtype=float).reshape(-1, 2)
+        if weights is None:
+            weights = np.ones(len(cs))
+        else:
+            weights = np.asarray(weights, dtype=float).ravel()
+            if weights.shape != (len(cs),):
+                raise ValueError('there should be one weight per conformation')
+            if np.any(weights < 0):
+                raise ValueError('weights can not be negative')
+        moments = self._moments.setdefault(linkage, _Moments())
+        inside = np.isfinite(cs).all(axis=1)
+        moments.n_outside += np.count_nonzero(~inside)
+        moments.outside_weight += weights[~inside].sum()
+        cs = cs[inside]
+        weights = weights[inside]
+        weight = weights.sum()
+        if weight == 0:
+            return
+        mean = np.dot(weights, cs) / weight
+        m2 = np.dot(weights, (cs - mean) ** 2)
+        moments.combine(len(cs), weight, mean, m2)
+
+    def add_glycan(self, glycan, frames, weights=None, chunk_size=1000):
+        """
+        Add the frames of a trajectory of a glycan.
+
+        Each glycosidic bond of the glycan is averaged separately, they are
+        named (disaccharide, donor, acceptor), see `Glycan.linkages`.
+
+        Parameters
+        ----------
+        glycan : Glycan
+            glycan used to compute the chemical shifts
+        frames : iterable
+            (n_atoms, 3) coordinates of each frame, e.g. as returned by
+            `read_pdb`
+        weights : array
+            population of each frame, if None (default) all frames have the
+            same weight
+        chunk_size : int
+            number of frames computed at once
+        """
+        names = [(link.disaccharide, link.donor, link.acceptor)
+                 for link in glycan.linkages]
+        start = 0
+        for cs in glycan.compute_cs(frames, chunk_size, self.ef_corr):
+            chunk_weights = None
+            if weights is not None:
+                chunk_weights = weights[start:start + len(cs)]
+            for i, name in enumerate(names):
+                self.add_cs(name, cs[:, i], chunk_weights)
+            start += len(cs)
+
+    def merge(self, other):
+        """
+        Add the conformations accumulated by another EnsembleAverage, e.g.
+        computed by another process.
+
+        Parameters
+        ----------
+        other : EnsembleAverage
+            averages to add to this one
+        """
+        for linkage, moments in other._moments.items():
+            mine = self._moments.setdefault(linkage, _Moments())
+            mine.n_outside += moments.n_outside
+            mine.outside_weight += moments.outside_weight
+            if moments.weight > 0:
+                mine.combine(moments.n, moments.weight, moments.mean,
+                             moments.m2)
+        return self
+
+    def mean(self, linkage):
+        """
+        Population weighted mean of the chemical shifts of the first and
+        second carbon of a glycosidic bond, `nan` if no conformation inside
+        the zone of computed values was added.
+        """
+        return self._moments[linkage].mean.copy()
+
+    def variance(self, linkage):
+        """
+        Population weighted variance of the chemical shifts of the first and
+        second carbon of a glycosidic bond.
+        """
+        moments = self._moments[linkage]
+        if moments.weight == 0:
+            return np.full(2, np.nan)
+        return moments.m2 / moments.weight
+
+    def std(self, linkage):
+        """
+        Population weighted standard deviation of the chemical shifts of the
+        first and second carbon of a glycosidic bond.
+        """
+        return np.sqrt(self.variance(linkage))
+
+    def n_frames(self, linkage):
+        """
+        Number of conformations included in the averages of a glycosidic
+        bond.
+        """
+        return self._moments[linkage].n
+
+    def n_outside(self, linkage):
+        """
+        Number of conformations of a glycosidic bond outside the zone of
+        computed values, not included in the averages.
+        """
+        return self._moments[linkage].n_outside
+
+    def outside_weight(self, linkage):
+        """
+        Total weight of the conformations of a glycosidic bond outside the
+        zone of computed values.
+        """
+        return self._moments[linkage].outside_weight
+
+
+def fit_populations(design, observed, sigma=1., method='nnls', theta=1.,
+                    prior=None):
+    """
+    Fit the populations of an ensemble of candidate conformations so that
+    their average chemical shifts match the observed ones.
+
+    With `method='nnls'` the populations minimize the chi squared between
+    the averaged and the observed chemical shifts, subject to being non
+    negative and adding up to 1. The solution is sparse, at most one more
+    conformation than observed chemical shifts get a population. With
+    `method='maxent'` the populations are the maximum entropy (Bayesian
+    ensemble refinement) reweighting of `prior`, balancing the chi squared
+    and the relative entropy with `theta`. The problem is solved in its dual
+    form, with one variable per observed chemical shift, so it is fast for
+    thousands of candidates.
+
+    Parameters
+    ----------
+    design : array
+        (n_observed, n_candidates) array with the chemical shifts of each
+        candidate conformation, e.g. the C1 and Cx of one or more glycosidic
+        bonds. Candidates with non finite chemical shifts (outside the zone of
+        computed values) get population 0
+    observed : array
+        (n_observed,) observed chemical shifts
+    sigma : float or array
+        errors of the observed chemical shifts. Default value is 1
+    method : string
+        `nnls` (default) or `maxent`
+    theta : float
+        confidence in the prior for `maxent`, larger values keep the
+        populations closer to the prior. Default value is 1
+    prior : array
+        (n_candidates,) prior populations for `maxent`, if None (default) all
+        candidates have the same prior
+
+    Returns
+    ----------
+    populations : array
+        (n_candidates,) fitted populations, adding up to 1
+    """
+    design = np.atleast_2d(np.asarray(design, dtype=float))
+    observed = np.asarray(observed, dtype=float).ravel()
+    if design.shape[0] != len(observed):
+        raise ValueError('design should have one row per observed chemical '
+                         'shift')
+    if method not in ('nnls', 'maxent'):
+        raise ValueError("method should be 'nnls' or 'maxent'")
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), observed.shape)
+    finite = np.isfinite(design).all(axis=0)
+    if not finite.any():
+        raise ValueError('all the candidates are outside the zone of computed '
+                         'values')
+    # deviations from the observed values, in units of sigma
+    residuals = (design[:, finite] - observed[:, None]) / sigma[:, None]
+
+    populations = np.zeros(design.shape[1])
+    if method == 'nnls':
+        # the normalization is imposed as a heavily weighted extra row
+        penalty = 1e3 * max(1., np.abs(residuals).max())
+        matrix = np.vstack([residuals, np.full(residuals.shape[1], penalty)])
+        target = np.zeros(len(matrix))
+        target[-1] = penalty
+        weights = nnls(matrix, target)[0]
+    else:
+        if prior is None:
+            log_prior = np.zeros(residuals.shape[1])
+        else:
+            with np.errstate(divide='ignore'):
+                log_prior = np.log(np.asarray(prior, dtype=float)[finite])
+
+        def dual(lambdas):
+            log_weights = log_prior - lambdas @ residuals
+            log_z = logsumexp(log_weights)
+            weights = np.exp(log_weights - log_z)
+            value = log_z + theta / 2 * np.sum(lambdas ** 2)
+            gradient = -residuals @ weights + theta * lambdas
+            return value, gradient
+
+        lambdas = minimize(dual, np.zeros(len(observed)), jac=True,
+                           method='L-BFGS-B').x
+        log_weights = log_prior - lambdas @ residuals
+        weights = np.exp(log_weights - logsumexp(log_weights))
+    populations[finite] = weights / weights.sum()
+    return populations
+
+
+def fit_lut_populations(chesweet, observed, rows=None, sigma=1.,
+                        method='nnls', theta=1., ef_corr=183.4):
+    """
+    Fit the populations of the conformations of the look-up tables to the
+    observed chemical shifts of one or more glycosidic bonds, e.g. all the
+    bonds of a glycan.
+
+    The design matrix of each bond is made of the pre-calculated
+    shieldings of the look-up table, turned into chemical shifts with
+    `ef_corr`, see `fit_populations`.
+
+    Parameters
+    ----------
+    chesweet : CheSweet
+        CheSweet instance with the look-up tables
+    observed : list
+        (disaccharide, cs0, cs1) of each glycosidic bond
+    rows : list
+        rows of the look-up table used as candidates for each bond, e.g. as
+        returned by `compute_tors_many` with `return_index=True`. If None
+        (default) all the conformations of the look-up tables are used
+    sigma : float or tuple
+        errors of the observed chemical shifts, one value for both carbons or
+        one for each carbon. Default value is 1
+    method, theta :
+        see `fit_populations`
+    ef_corr : float
+        correction values used to turn shielding into chemical shifts.
+        Default value is 183.4
+
+    Returns
+    ----------
+    populations : list
+        one array for each bond with the populations of the candidate rows
+    """
+    if rows is None:
+        rows = [None] * len(observed)
+    populations = []
+    for (disaccharide, cs0, cs1), candidates in zip(observed, rows):
+        table = chesweet.lt[chesweet.tables[disaccharide].key]
+        if candidates is None:
+            candidates = slice(None)
+        design = ef_corr - table[candidates, -2:].T
+        populations.append(fit_populations(design, [cs0, cs1], sigma, method,
+                                           theta))
+    return populations
+
+
+class _Moments():
+    """
+    Accumulated weight, weighted mean and weighted sum of squared deviations
+    of the chemical shifts of a glycosidic bond.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.weight = 0.
+        self.mean = np.full(2, np.nan)
+        self.m2 = np.zeros(2)
+        self.n_outside = 0
+        self.outside_weight = 0.
+
+    def combine(self, n, weight, mean, m2):
+        if self.weight == 0:
+            self.mean = np.array(mean, dtype=float)
+            self.m2 = np.array(m2, dtype=float)
+        else:
+            total = self.weight + weight
+            delta = mean - self.mean
+            self.mean = self.mean + delta * weight / total
+            self.m2 = self.m2 + m2 + delta ** 2 * self.weight * weight / total
+        self.n += n
+        self.weight += weight
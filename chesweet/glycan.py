@@ -0,0 +1,367 @@
+"""
+Chemical shifts of the glycosidic bonds of whole glycans, from structures or
+trajectories.
+"""
+from collections import namedtuple
+import numpy as np
+
+
+# PDB chemical component codes of the monosaccharides in CheSweet's lut
+RESIDUE_NAMES = {'GLC': 'a-D-Glcp', 'BGC': 'b-D-Glcp',
+                 'GLA': 'a-D-Galp', 'GAL': 'b-D-Galp',
+                 'MAN': 'a-D-Manp', 'BMA': 'b-D-Manp',
+                 'NDG': 'a-D-GlcpNAc', 'NAG': 'b-D-GlcpNAc',
+                 'A2G': 'a-D-GalpNAc', 'NGA': 'b-D-GalpNAc',
+                 'FUC': 'a-L-Fucp', 'FUL': 'b-L-Fucp',
+                 'XYS': 'a-D-Xylp', 'XYP': 'b-D-Xylp',
+                 'GCU': 'a-D-GlcpA', 'BDP': 'b-D-GlcpA',
+                 'FRU': 'b-D-Fruf', 'MUB': 'b-D-MurpNAc'}
+
+
+Linkage = namedtuple('Linkage', ['disaccharide', 'donor', 'acceptor',
+                                 'position', 'atoms'])
+Linkage.__doc__ = """
+Glycosidic bond between the C1 of a donor residue and the oxygen at
+`position` of an acceptor residue.
+
+disaccharide : string
+    name of the disaccharide, as used by CheSweet
+donor, acceptor : tuple
+    (chain, residue number, residue name) of each residue
+position : int
+    carbon of the acceptor residue in the glycosidic bond
+atoms : array
+    (5, 4) array with the indices of the atoms defining phi, psi, chi1, chi2
+    and chi3, -1 for torsionals not defined for this bond
+"""
+
+
+class Glycan():
+    """
+    Compute the chemical shifts of all the glycosidic bonds of a glycan, for
+    one structure or for all the frames of a trajectory.
+
+    The glycosidic bonds are detected from the coordinates of the first
+    frame, and only bonds present in CheSweet's lookup table are kept. The
+    torsional angles are defined using hydrogen atoms (see `torsionals`),
+    so structures should include them. Bonds that are not in the lookup
+    table, or whose torsionals can not be defined from the atoms of the
+    structure, are listed in `missing`.
+    """
+
+    def __init__(self, chesweet, atoms, coords, residue_names=None,
+                 cutoff=1.7):
+        """
+        Parameters
+        ----------
+        chesweet : CheSweet
+            CheSweet instance used to compute the chemical shifts
+        atoms : list
+            (chain, residue number, residue name, atom name) of each atom, as
+            returned by `read_pdb`
+        coords : array
+            (n_atoms, 3) coordinates used to detect the glycosidic bonds
+        residue_names : dictionary
+            names of the residues, as used by CheSweet, keys are residue
+            names in `atoms` or (chain, residue number) tuples. Residues not
+            included are named using `RESIDUE_NAMES`
+        cutoff : float
+            maximum distance between C1 and the glycosidic oxygen in Angstrom
+        """
+        self.chesweet = chesweet
+        self.atoms = atoms
+        linkages = find_linkages(atoms, coords, residue_names, cutoff)
+        self.linkages = []
+        self.missing = []
+        for link in linkages:
+            if link.disaccharide in chesweet.tables and _defined(chesweet, link):
+                self.linkages.append(link)
+            else:
+                self.missing.append(link)
+
+    def torsionals(self, coords):
+        """
+        Compute the torsional angles of the glycosidic bonds.
+
+        phi is H1-C1-Ox'-Cx' and psi is C1-Ox'-Cx'-Hx' (C5' for 1-6 bonds
+        and C1' for 1-2 bonds to ketoses, which have no H2'). For 1-6 bonds
+        omega (O5'-C5'-C6'-O6') is the first chi angle. The remaining chi
+        angles are the orientation of the substituents next to the
+        glycosidic bond, the one at C2 of the donor residue and those at
+        Cx-1' and Cx+1' of the acceptor residue (O5'-C2'-C1'-O1' for the
+        hydroxymethyl group at C1' of ketoses), for 1-1 bonds only the
+        hydroxyls at C2 and C2' (chi1 and chi2). Chi angles are only used
+        with `full=True`.
+
+        Parameters
+        ----------
+        coords : array
+            (n_atoms, 3) or (n_frames, n_atoms, 3) coordinates
+
+        Returns
+        ----------
+        tors : array
+            (n_frames, n_linkages, 5) array with phi, psi, chi1, chi2 and
+            chi3 in degrees, NaN for torsionals not defined
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, len(self.atoms), 3)
+        atoms = np.array([link.atoms for link in self.linkages],
+                         dtype=int).reshape(-1, 4)
+        tors = dihedrals(coords, atoms)
+        return tors.reshape(len(coords), len(self.linkages), 5)
+
+    def compute_cs(self, frames, chunk_size=1000, ef_corr=183.4):
+        """
+        Compute the chemical shifts of the glycosidic bonds for a stream of
+        frames.
+
+        Frames are processed in chunks so memory use does not depend on the
+        length of the trajectory.
+
+        Parameters
+        ----------
+        frames : iterable
+            (n_atoms, 3) coordinates of each frame, e.g. as returned by
+            `read_pdb`
+        chunk_size : int
+            number of frames computed at once
+        ef_corr : float
+            correction values used to turn shielding into chemical shifts.
+            Default value is 183.4
+
+        Returns
+        ----------
+        cs : generator
+            (n_frames_chunk, n_linkages, 2) arrays with the chemical shifts
+            of the first and second carbon of each glycosidic bond, in the
+            order of `linkages`
+        """
+        chunk = []
+        for coords in frames:
+            chunk.append(coords)
+            if len(chunk) == chunk_size:
+                yield self._compute_chunk(np.array(chunk, dtype=float), ef_corr)
+                chunk = []
+        if chunk:
+            yield self._compute_chunk(np.array(chunk, dtype=float), ef_corr)
+
+    def _compute_chunk(self, coords, ef_corr):
+        tors = self.torsionals(coords)
+        cs = np.empty((len(coords), len(self.linkages), 2))
+        for i, link in enumerate(self.linkages):
+            cs[:, i] = self.chesweet.compute_cs_many(link.disaccharide,
+                                                     *tors[:, i].T,
+                                                     ef_corr=ef_corr)
+        return cs
+
+
+def read_pdb(fname):
+    """
+    Read the atoms and coordinates of a PDB file, with one or many models.
+
+    Parameters
+    ----------
+    fname : string
+        path to the PDB file
+
+    Returns
+    ----------
+    atoms : list
+        (chain, residue number, residue name, atom name) of each ATOM or
+        HETATM record of the first model
+    frames : generator
+        (n_atoms, 3) coordinates of each model, models are read from the
+        file as they are requested
+    """
+    models = _read_models(fname)
+    try:
+        atoms, coords = next(models)
+    except StopIteration:
+        raise ValueError('I could not find atoms in {}'.format(fname))
+
+    def frames():
+        yield coords
+        for _, model_coords in models:
+            yield model_coords
+
+    return atoms, frames()
+
+
+def _read_models(fname):
+    """
+    Iterate over the models of a PDB file, yielding atoms and coordinates.
+    """
+    atoms = []
+    coords = []
+    with open(fname) as fh:
+        for line in fh:
+            record = line[:6].strip()
+            if record in ('ATOM', 'HETATM'):
+                atoms.append((line[21].strip(), int(line[22:26]),
+                              line[17:20].strip(), line[12:16].strip()))
+                coords.append((float(line[30:38]), float(line[38:46]),
+                               float(line[46:54])))
+            elif record == 'ENDMDL' and coords:
+                yield atoms, np.array(coords)
+                atoms = []
+                coords = []
+    if coords:
+        yield atoms, np.array(coords)
+
+
+def find_linkages(atoms, coords, residue_names=None, cutoff=1.7):
+    """
+    Find the glycosidic bonds of a glycan.
+
+    A glycosidic bond joins the C1 atom of a donor residue and an oxygen
+    atom Ox of an acceptor residue (as in PDB files, the glycosidic oxygen
+    belongs to the acceptor residue).
+
+    Parameters
+    ----------
+    atoms : list
+        (chain, residue number, residue name, atom name) of each atom
+    coords : array
+        (n_atoms, 3) coordinates
+    residue_names : dictionary
+        names of the residues, as used by CheSweet, keys are residue names in
+        `atoms` or (chain, residue number) tuples. Residues not included are
+        named using `RESIDUE_NAMES`
+    cutoff : float
+        maximum distance between C1 and the glycosidic oxygen in Angstrom
+
+    Returns
+    ----------
+    linkages : list
+        `Linkage` of each glycosidic bond between named residues
+    """
+    coords = np.asarray(coords, dtype=float)
+    names = dict(RESIDUE_NAMES)
+    if residue_names is not None:
+        names.update(residue_names)
+
+    index = {}
+    residues = []
+    for i, (chain, resnum, resname, atom) in enumerate(atoms):
+        residue = (chain, resnum, resname)
+        if residue not in residues:
+            residues.append(residue)
+        index[residue, atom] = i
+
+    def residue_name(residue):
+        return names.get(residue[:2], names.get(residue[2]))
+
+    linkages = []
+    for donor in residues:
+        if residue_name(donor) is None or (donor, 'C1') not in index:
+            continue
+        c1 = coords[index[donor, 'C1']]
+        for acceptor in residues:
+            if acceptor == donor or residue_name(acceptor) is None:
+                continue
+            for position in range(1, 7):
+                oxygen = index.get((acceptor, 'O{}'.format(position)))
+                if oxygen is None:
+                    continue
+                if np.linalg.norm(coords[oxygen] - c1) < cutoff:
+                    disaccharide = '{}-1-{}-{}'.format(residue_name(donor),
+                                                       position,
+                                                       residue_name(acceptor))
+                    tors = _torsional_atoms(index, donor, acceptor, position)
+                    linkages.append(Linkage(disaccharide, donor, acceptor,
+                                            position, tors))
+    return linkages
+
+
+def _defined(chesweet, link):
+    """
+    Whether the atoms of a glycosidic bond define all the torsionals of its
+    look-up table.
+    """
+    n_columns = len(chesweet.tables[link.disaccharide].columns)
+    return np.all(link.atoms[:n_columns] >= 0)
+
+
+def _torsional_atoms(index, donor, acceptor, x):
+    """
+    Indices of the atoms defining phi, psi, chi1, chi2 and chi3 of a
+    glycosidic bond, see `Glycan.torsionals`.
+    """
+    d, a = donor, acceptor
+
+    def hydroxyl(residue, n):
+        # orientation of the hydroxyl (or amide) group at carbon n
+        return [[(residue, 'H{}'.format(n)), (residue, 'C{}'.format(n)),
+                 (residue, '{}{}'.format(atom, n)), (residue, h.format(n))]
+                for atom, h in (('O', 'HO{}'), ('O', 'H{}O'), ('N', 'HN{}'))]
+
+    def substituent(residue, n):
+        # hydroxymethyl groups at C5 (or at C1 of ketoses) or hydroxyl groups
+        if n == 5:
+            return [[(residue, 'O5'), (residue, 'C5'), (residue, 'C6'),
+                     (residue, 'O6')]]
+        elif n == 1:
+            return hydroxyl(residue, 1) + [[(residue, 'O5'), (residue, 'C2'),
+                                            (residue, 'C1'), (residue, 'O1')]]
+        elif 2 <= n <= 4:
+            return hydroxyl(residue, n)
+        return []
+
+    phi = [[(d, 'H1'), (d, 'C1'), (a, 'O{}'.format(x)), (a, 'C{}'.format(x))]]
+    psi = [[(d, 'C1'), (a, 'O{}'.format(x)), (a, 'C{}'.format(x)),
+            (a, 'H{}'.format(x))]]
+    if x == 2:
+        # the anomeric carbon of ketoses (e.g. C2 of Fruf) has no hydrogen
+        psi.append([(d, 'C1'), (a, 'O2'), (a, 'C2'), (a, 'C1')])
+    if x == 6:
+        # C6 has two hydrogens, use C5 instead
+        psi.append([(d, 'C1'), (a, 'O6'), (a, 'C6'), (a, 'C5')])
+        omega = [[(a, 'O5'), (a, 'C5'), (a, 'C6'), (a, 'O6')]]
+        chis = [omega, hydroxyl(d, 2), hydroxyl(a, 4)]
+    elif x == 1:
+        chis = [hydroxyl(d, 2), hydroxyl(a, 2)]
+    else:
+        chis = [hydroxyl(d, 2), substituent(a, x - 1), substituent(a, x + 1)]
+
+    atoms = np.full((5, 4), -1, dtype=int)
+    for i, candidates in enumerate([phi, psi] + chis):
+        for candidate in candidates:
+            if all(atom in index for atom in candidate):
+                atoms[i] = [index[atom] for atom in candidate]
+                break
+    return atoms
+
+
+def dihedrals(coords, atoms):
+    """
+    Compute dihedral angles for many frames at once.
+
+    Parameters
+    ----------
+    coords : array
+        (n_frames, n_atoms, 3) coordinates
+    atoms : array
+        (n_dihedrals, 4) indices of the atoms defining each dihedral, rows
+        with negative indices give NaN
+
+    Returns
+    ----------
+    angles : array
+        (n_frames, n_dihedrals) dihedral angles in degrees, in the interval
+        [-180, 180]
+    """
+    atoms = np.asarray(atoms, dtype=int)
+    p0, p1, p2, p3 = [coords[:, atoms[:, k]] for k in range(4)]
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    # undefined dihedrals may have overlapping atoms
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b1 /= np.linalg.norm(b1, axis=-1, keepdims=True)
+        v = b0 - np.sum(b0 * b1, axis=-1, keepdims=True) * b1
+        w = b2 - np.sum(b2 * b1, axis=-1, keepdims=True) * b1
+        x = np.sum(v * w, axis=-1)
+        y = np.sum(np.cross(b1, v) * w, axis=-1)
+        angles = np.degrees(np.arctan2(y, x))
+    angles[:, np.any(atoms < 0, axis=1)] = np.nan
+    return angles
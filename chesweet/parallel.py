@@ -0,0 +1,135 @@
+"""
+Compute chemical shifts or torsional angles of large ensembles using many
+processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+from .chesweet import CheSweet, _broadcast_tors
+
+
+# CheSweet instance of each worker process
+_worker = None
+
+
+class ParallelCheSweet():
+    """
+    Split the computation of chemical shifts or torsional angles of many
+    conformations in chunks, computed by a pool of processes.
+
+    Each worker process loads the lookup tables from the binary copy kept
+    in the cache folder (see `CheSweet`), memory mapped, so the text files
+    are not parsed again by each one. Each worker builds its own dense grid
+    of shieldings from them, the first time a disaccharide is used. Results
+    are returned in the same order as the input.
+    """
+
+    def __init__(self, path=None, full=False, cache=True, disaccharides=None,
+                 processes=None, chunk_size=100000):
+        """
+        Parameters
+        ----------
+        path : string
+            folder of lookup table, if None (default) CheSweet's lookup table will be used
+        full : Boolean
+            whether to include chi's torsional angles (True) in the computation
+            of chemical shifts or not (False)
+        cache : Boolean or string
+            binary copy of the lookup table used by the worker processes, see
+            `CheSweet`. If False each process reads the text files
+        disaccharides : list
+            names of the disaccharides to use, if None (default) all the
+            disaccharides in the lookup table are available
+        processes : int
+            number of worker processes, if None (default) the number of CPUs
+        chunk_size : int
+            number of conformations (or pairs of chemical shifts) sent to a
+            worker at once
+        """
+        self.chunk_size = chunk_size
+        self.processes = processes or os.cpu_count() or 1
+        kwargs = {'path': path, 'full': full, 'cache': cache,
+                  'disaccharides': disaccharides}
+        # check the names of the disaccharides and build the binary copy of
+        # their tables once, before starting the workers. Other tables are
+        # read (and copied) by the workers when they are first used
+        lut = CheSweet(path=path, full=full, cache=cache)
+        if disaccharides is not None:
+            names = [d if full else d + '_red' for d in disaccharides]
+            missing = set(names) - set(lut.lt)
+            if missing:
+                raise ValueError('{} not in the look-up table'.format(
+                    ', '.join(sorted(missing))))
+            if cache:
+                for name in names:
+                    lut.lt[name]
+        self._pool = ProcessPoolExecutor(self.processes,
+                                         initializer=_init_worker,
+                                         initargs=(kwargs,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        self._pool.shutdown()
+
+    def compute_cs_many(self, disaccharide, phi, psi, chi1=None, chi2=None,
+                        chi3=None, ef_corr=183.4):
+        """
+        Compute the chemical shifts for many sets of torsional angles.
+
+        Parameters and returned values are the same as in
+        `CheSweet.compute_cs_many`.
+        """
+        tors = _broadcast_tors(phi, psi, chi1, chi2, chi3)
+        chunks = [(disaccharide, [tor[start:start + self.chunk_size]
+                                  for tor in tors], ef_corr)
+                  for start in range(0, len(tors[0]), self.chunk_size)]
+        results = list(self._pool.map(_compute_cs_chunk, chunks))
+        if not results:
+            return np.empty((0, 2))
+        return np.concatenate(results)
+
+    def compute_tors_many(self, disaccharide, cs0, cs1, ef_corr=183.4, eps=0.5,
+                          norm='box', return_index=False):
+        """
+        Compute the torsional angles compatible with many pairs of chemical
+        shifts.
+
+        Parameters and returned values are the same as in
+        `CheSweet.compute_tors_many`.
+        """
+        cs0, cs1 = np.broadcast_arrays(np.asarray(cs0, dtype=float),
+                                       np.asarray(cs1, dtype=float))
+        cs0 = cs0.ravel()
+        cs1 = cs1.ravel()
+        chunks = [(disaccharide, cs0[start:start + self.chunk_size],
+                   cs1[start:start + self.chunk_size], ef_corr, eps, norm,
+                   return_index)
+                  for start in range(0, len(cs0), self.chunk_size)]
+        theoric_tors = []
+        for result in self._pool.map(_compute_tors_chunk, chunks):
+            theoric_tors.extend(result)
+        return theoric_tors
+
+
+def _init_worker(kwargs):
+    global _worker
+    _worker = CheSweet(**kwargs)
+
+
+def _compute_cs_chunk(args):
+    disaccharide, tors, ef_corr = args
+    return _worker.compute_cs_many(disaccharide, *tors, ef_corr=ef_corr)
+
+
+def _compute_tors_chunk(args):
+    disaccharide, cs0, cs1, ef_corr, eps, norm, return_index = args
+    return _worker.compute_tors_many(disaccharide, cs0, cs1, ef_corr, eps,
+                                     norm, return_index)
@@ -0,0 +1,267 @@
+"""
+Asynchronous access to CheSweet, to serve chemical shifts to many clients
+from asyncio code, and a minimal HTTP/JSON server built on it.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import math
+import numpy as np
+from .chesweet import _broadcast_tors
+
+
+class AsyncCheSweet():
+    """
+    Compute chemical shifts or torsional angles from asyncio code without
+    blocking the event loop.
+
+    Requests for the same disaccharide (and parameters) made within `delay`
+    seconds are coalesced into a single call to `compute_cs_many` (or
+    `compute_tors_many`) that runs in an executor, so many concurrent small
+    requests cost about the same as one vectorized batch. The look-up tables
+    are loaded once and shared by all the requests.
+    """
+
+    def __init__(self, chesweet, executor=None, delay=0.002, max_batch=100000):
+        """
+        Parameters
+        ----------
+        chesweet : CheSweet or ParallelCheSweet
+            used to compute the batches. With a ParallelCheSweet each batch is
+            split between its worker processes
+        executor : Executor
+            executor that computes the batches, if None (default) a thread
+        delay : float
+            time in seconds to wait for more requests before computing a
+            batch. Default value is 0.002
+        max_batch : int
+            a batch is computed right away when it reaches this number of
+            conformations (or pairs of chemical shifts)
+        """
+        self.chesweet = chesweet
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(1)
+        self.executor = executor
+        self.delay = delay
+        self.max_batch = max_batch
+        self._pending = {}
+
+    def close(self):
+        """
+        Shut down the executor, if it was created by AsyncCheSweet.
+        """
+        if self._own_executor:
+            self.executor.shutdown()
+
+    async def compute_cs(self, disaccharide, phi, psi, chi1=None, chi2=None,
+                         chi3=None, ef_corr=183.4):
+        """
+        Compute the chemical shifts of one or many sets of torsional angles.
+
+        Parameters are the same as in `CheSweet.compute_cs_many`.
+
+        Returns
+        ----------
+        cs : array
+            chemical shifts of the first and second carbon in the glycosidic
+            bond, with shape (2,) for a single conformation or (N, 2)
+        """
+        scalar = all(np.ndim(tor) == 0 for tor in (phi, psi, chi1, chi2, chi3))
+        tors = _broadcast_tors(phi, psi, chi1, chi2, chi3)
+        cs = await self._submit(('cs', disaccharide, ef_corr), tors,
+                                len(tors[0]))
+        if scalar:
+            return cs[0]
+        return cs
+
+    async def compute_tors(self, disaccharide, cs0, cs1, ef_corr=183.4,
+                           eps=0.5, norm='box'):
+        """
+        Retrieve the torsional angles compatible with one or many pairs of
+        chemical shifts.
+
+        Parameters are the same as in `CheSweet.compute_tors_many`.
+
+        Returns
+        ----------
+        theoric_tors : array or list
+            torsionals in the range of `eps`, a list with one array for each
+            pair when `cs0` and `cs1` are arrays
+        """
+        scalar = np.ndim(cs0) == 0 and np.ndim(cs1) == 0
+        cs0, cs1 = np.broadcast_arrays(np.asarray(cs0, dtype=float),
+                                       np.asarray(cs1, dtype=float))
+        tors = await self._submit(('tors', disaccharide, ef_corr, eps, norm),
+                                  (cs0.ravel(), cs1.ravel()), cs0.size)
+        if scalar:
+            return tors[0]
+        return tors
+
+    async def _submit(self, key, data, size):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if key not in self._pending:
+            self._pending[key] = _Batch(loop.call_later(self.delay,
+                                                        self._flush, key))
+        batch = self._pending[key]
+        batch.requests.append((data, size, future))
+        batch.size += size
+        if batch.size >= self.max_batch:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.handle.cancel()
+        data = [np.concatenate(arrays)
+                for arrays in zip(*[request[0] for request in batch.requests])]
+        if key[0] == 'cs':
+            _, disaccharide, ef_corr = key
+            func = partial(self.chesweet.compute_cs_many, disaccharide, *data,
+                           ef_corr=ef_corr)
+        else:
+            _, disaccharide, ef_corr, eps, norm = key
+            func = partial(self.chesweet.compute_tors_many, disaccharide, *data,
+                           ef_corr=ef_corr, eps=eps, norm=norm)
+        task = asyncio.get_running_loop().run_in_executor(self.executor, func)
+        task.add_done_callback(partial(_dispatch, batch.requests))
+
+
+class _Batch():
+    """
+    Requests waiting to be computed together.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        self.size = 0
+
+
+def _dispatch(requests, task):
+    """
+    Split the result of a batch between the requests that made it.
+    """
+    try:
+        result = task.result()
+    except Exception as error:
+        for _, _, future in requests:
+            if not future.done():
+                future.set_exception(error)
+        return
+    start = 0
+    for _, size, future in requests:
+        if not future.done():
+            future.set_result(result[start:start + size])
+        start += size
+
+
+async def serve(service, host='127.0.0.1', port=8000):
+    """
+    Start a minimal HTTP server that computes chemical shifts and torsional
+    angles from JSON requests.
+
+    `POST /cs` takes an object with `disaccharide`, `phi`, `psi` and
+    optionally `chi1`, `chi2`, `chi3` and `ef_corr` (numbers or lists) and
+    returns `{"cs": [[cs0, cs1], ...]}`, chemical shifts outside the zone of
+    computed values are `null`. `POST /tors` takes `disaccharide`, `cs0`,
+    `cs1` and optionally `ef_corr`, `eps` and `norm` and returns
+    `{"tors": [[[phi, psi, ...], ...], ...]}`, a list of torsionals for each
+    pair of chemical shifts. Errors are returned as `{"error": message}`.
+
+    Parameters
+    ----------
+    service : AsyncCheSweet
+        used to compute the requests
+    host : string
+        address to listen on. Default value is 127.0.0.1
+    port : int
+        port to listen on, 0 to use any free port. Default value is 8000
+
+    Returns
+    ----------
+    server : asyncio.Server
+    """
+    return await asyncio.start_server(partial(_handle, service), host, port)
+
+
+def run_server(chesweet, host='127.0.0.1', port=8000, **kwargs):
+    """
+    Run the HTTP server of `serve` until interrupted.
+
+    Parameters
+    ----------
+    chesweet : CheSweet or ParallelCheSweet
+        used to compute the requests
+    host, port :
+        see `serve`
+    kwargs :
+        passed to `AsyncCheSweet`
+    """
+    async def main():
+        service = AsyncCheSweet(chesweet, **kwargs)
+        server = await serve(service, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+
+    asyncio.run(main())
+
+
+async def _handle(service, reader, writer):
+    try:
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        body = await reader.readexactly(length)
+        status, response = await _route(service, method, path, body)
+    except (asyncio.IncompleteReadError, ValueError) as error:
+        status, response = 400, {'error': str(error)}
+    payload = json.dumps(response).encode()
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}
+    header = ('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+              'Content-Length: {}\r\nConnection: close\r\n\r\n').format(
+                  status, reasons[status], len(payload))
+    writer.write(header.encode() + payload)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def _route(service, method, path, body):
+    if method != 'POST' or path not in ('/cs', '/tors'):
+        return 404, {'error': 'use POST /cs or POST /tors'}
+    try:
+        params = json.loads(body.decode() or '{}')
+        if path == '/cs':
+            cs = await service.compute_cs(
+                params['disaccharide'], np.atleast_1d(params['phi']),
+                params['psi'], params.get('chi1'), params.get('chi2'),
+                params.get('chi3'), ef_corr=params.get('ef_corr', 183.4))
+            # JSON has no infinity
+            cs = [[None if math.isinf(value) else value for value in row]
+                  for row in cs.tolist()]
+            return 200, {'cs': cs}
+        else:
+            tors = await service.compute_tors(
+                params['disaccharide'], np.atleast_1d(params['cs0']),
+                params['cs1'], ef_corr=params.get('ef_corr', 183.4),
+                eps=params.get('eps', 0.5), norm=params.get('norm', 'box'))
+            return 200, {'tors': [tor.tolist() for tor in tors]}
+    except KeyError as error:
+        return 400, {'error': 'unknown or missing {}'.format(error)}
+    except (TypeError, ValueError) as error:
+        return 400, {'error': str(error)}
@@ -256,3 +256,473 @@ def test_compute_tors_red():
             if y.size != 0:
                 np.testing.assert_array_almost_equal(x, y, decimal=1, verbose=True)
 
+
+
+def test_compute_cs_many():
+    # on the edges of the grid cells, including the borders
+    phi = np.array([-180, -70, -105, 120, 135, 0, 40, 180, -175, 171.5])
+    psi = np.array([-130, 120, 60, -123.4, 60, -10, -20, 170, 60, 70])
+    chi = np.array([180, 60, 64.2, -60, 175, 60, 60, -60, 180, 60])
+    for disaccharides in [disaccharides_red, disaccharides_full]:
+        for disaccharide in disaccharides_list:
+            if disaccharides.full:
+                if disaccharide == 'a-D-Glcp-1-1-a-D-Glcp':
+                    chis = [chi, chi[::-1]]
+                else:
+                    chis = [chi, chi[::-1], np.roll(chi, 3)]
+            elif disaccharide == 'b-D-Galp-1-6-b-D-Galp':
+                chis = [chi]
+            else:
+                chis = []
+            cs_many = disaccharides.compute_cs_many(disaccharide, phi, psi, *chis)
+            assert cs_many.shape == (len(phi), 2)
+            for i in range(len(phi)):
+                cs = disaccharides.compute_cs(disaccharide, phi[i], psi[i],
+                                              *[c[i] for c in chis])
+                np.testing.assert_almost_equal(cs_many[i], cs, decimal=4)
+
+    # and inside the cells of every table
+    rng = np.random.RandomState(0)
+    for disaccharides in [disaccharides_red, disaccharides_full]:
+        for disaccharide, info in disaccharides.tables.items():
+            phi, psi = rng.uniform(-180, 180, (2, 100))
+            chis = [rng.choice(axis, 100)
+                    for axis in info.axes[2:len(info.columns)]]
+            cs_many = disaccharides.compute_cs_many(disaccharide, phi, psi, *chis)
+            for i in range(len(phi)):
+                cs = disaccharides.compute_cs(disaccharide, phi[i], psi[i],
+                                              *[c[i] for c in chis])
+                np.testing.assert_almost_equal(cs_many[i], cs, decimal=8)
+
+
+def test_compute_cs_many_triangles():
+    from scipy.interpolate import LinearNDInterpolator
+    lt = disaccharides_red.lt['a-D-Galp-1-3-b-D-Galp_red']
+    # the corners of the cell are triangulated in the order of lt
+    rows = np.sort([np.flatnonzero((lt[:, 0] == p) & (lt[:, 1] == s))[0]
+                    for p in (100, 110) for s in (140, 150)])
+    phi = np.array([105.7, 104.3, 102., 108.])
+    psi = np.array([144.3, 145.7, 143., 147.])
+    ref = ef_corr - LinearNDInterpolator(lt[rows, :2], lt[rows, -2:])(phi, psi)
+    cs = disaccharides_red.compute_cs_many('a-D-Galp-1-3-b-D-Galp', phi, psi)
+    np.testing.assert_almost_equal(cs, ref, decimal=8)
+
+
+def test_grid():
+    for disaccharides in [disaccharides_red, disaccharides_full]:
+        for disaccharide, table in disaccharides.lt.items():
+            grid = disaccharides.grid[disaccharide]
+            axes = disaccharides.grid_axes[disaccharide]
+            assert grid.ndim == 6
+            assert np.sum(~np.isnan(grid[..., 0])) == len(table)
+            idx = [np.searchsorted(axis, table[:, col])
+                   for col, axis in enumerate(axes)]
+            idx += [0] * (5 - len(axes))
+            np.testing.assert_array_equal(grid[tuple(idx)], table[:, -2:])
+
+
+def test_cache(tmpdir):
+    import os
+    import shutil
+    from ..chesweet import _read_table
+    fname = os.path.join(os.path.dirname(__file__), '..', 'lut',
+                         'a-D-Glcp-1-1-a-D-Glcp_red')
+    lut_copy = str(tmpdir.join('a-D-Glcp-1-1-a-D-Glcp_red'))
+    shutil.copy(fname, lut_copy)
+    cache_dir = str(tmpdir.join('cache'))
+    ref = _read_table(lut_copy, 4)
+    table = _read_table(lut_copy, 4, cache_dir)
+    assert isinstance(table, np.memmap)
+    np.testing.assert_array_equal(table, ref)
+    assert len(os.listdir(cache_dir)) == 1
+    # the binary copy is rebuilt when the look-up table changes
+    with open(lut_copy, 'a') as fh:
+        fh.write('  180  180  80.0000  90.0000\n')
+    table = _read_table(lut_copy, 4, cache_dir)
+    assert len(table) == len(ref) + 1
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_lazy_load():
+    disaccharides_test = CheSweet()
+    assert disaccharides_test.lt.loaded() == []
+    disaccharides_test.compute_cs(disaccharides_list[0], 50, 60)
+    assert disaccharides_test.lt.loaded() == [disaccharides_list[0] + '_red']
+    assert len(disaccharides_test.lt) == len(disaccharides_red.lt)
+
+
+def test_load_disaccharides():
+    disaccharides_test = CheSweet(full=True, disaccharides=disaccharides_list[1:])
+    assert sorted(disaccharides_test.lt) == sorted(disaccharides_list[1:])
+    assert sorted(disaccharides_test.grid.loaded()) == sorted(disaccharides_list[1:])
+    try:
+        CheSweet(disaccharides=['a-D-Glcp-1-5-a-D-Glcp'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('unknown disaccharides should raise ValueError')
+
+
+def test_compute_tors_many():
+    for disaccharides in [disaccharides_red, disaccharides_full]:
+        for disaccharide in disaccharides_list:
+            cs0 = np.array([72.6629, 82.4441, 68.7441, 20, 80.1])
+            cs1 = np.array([94.3636, 90.0294, 112.9245, 150, 100.2])
+            tors = disaccharides.compute_tors_many(disaccharide, ef_corr - cs0,
+                                                   ef_corr - cs1, eps=0.8)
+            rows = disaccharides.compute_tors_many(disaccharide, ef_corr - cs0,
+                                                   ef_corr - cs1, eps=0.8,
+                                                   return_index=True)
+            euclidean = disaccharides.compute_tors_many(disaccharide,
+                                                        ef_corr - cs0,
+                                                        ef_corr - cs1, eps=0.8,
+                                                        norm='euclidean',
+                                                        return_index=True)
+            for i in range(len(cs0)):
+                ref = disaccharides.compute_tors(disaccharide, ef_corr - cs0[i],
+                                                 ef_corr - cs1[i], eps=0.8)
+                np.testing.assert_array_equal(tors[i], ref)
+                assert len(rows[i]) == len(ref)
+                assert set(euclidean[i]) <= set(rows[i])
+                x = disaccharides.lt[disaccharide if disaccharides.full
+                                     else disaccharide + '_red']
+                dist = np.hypot(x[:, -2] - cs0[i], x[:, -1] - cs1[i])
+                np.testing.assert_array_equal(euclidean[i],
+                                              np.flatnonzero(dist < 0.8))
+
+
+def test_compute_tors_nearest():
+    for disaccharides in [disaccharides_red, disaccharides_full]:
+        for disaccharide in disaccharides_list:
+            x_key = disaccharide if disaccharides.full else disaccharide + '_red'
+            x = disaccharides.lt[x_key]
+            tors, dist = disaccharides.compute_tors_nearest(disaccharide,
+                                                            80.1, 100.2, k=5)
+            assert dist.shape == (5,)
+            assert np.all(np.diff(dist) >= 0)
+            ref = np.sort(np.hypot(x[:, -2] - (ef_corr - 80.1),
+                                   x[:, -1] - (ef_corr - 100.2)))[:5]
+            np.testing.assert_almost_equal(dist, ref)
+            # the nearest conformations are in a box of size dist
+            box = disaccharides.compute_tors(disaccharide, 80.1, 100.2,
+                                             eps=dist[-1] + 1e-6)
+            for t in tors:
+                assert np.any(np.all(box == t, axis=1))
+            # weights and many pairs of chemical shifts
+            rows, dist = disaccharides.compute_tors_nearest(disaccharide,
+                                                            [80.1, 75.],
+                                                            [100.2, 95.],
+                                                            k=3, weights=(1, 0),
+                                                            return_index=True)
+            assert rows.shape == (2, 3)
+            np.testing.assert_almost_equal(dist[1], np.abs(x[rows[1], -2] -
+                                                           (ef_corr - 75.)))
+            # the tree of weighted shieldings is reused for the same relative
+            # weights
+            key = (x_key, (1., 0.))
+            tree = disaccharides._weighted_trees[key]
+            again = disaccharides.compute_tors_nearest(disaccharide, [80.1, 75.],
+                                                       [100.2, 95.], k=3,
+                                                       weights=[2, 0],
+                                                       return_index=True)
+            assert disaccharides._weighted_trees[key] is tree
+            np.testing.assert_array_equal(again[0], rows)
+            np.testing.assert_almost_equal(again[1], 2 * dist)
+            # and only a few trees are kept
+            for weight in np.linspace(0.1, 1, 20):
+                disaccharides.compute_tors_nearest(disaccharide, 80.1, 100.2,
+                                                   weights=(1, weight))
+            assert len(disaccharides._weighted_trees) <= 8
+
+
+def test_interpolator():
+    disaccharide = 'a-D-Galp-1-3-b-D-Galp'
+    interpolator = disaccharides_full.interpolator(disaccharide)
+    assert interpolator is disaccharides_full.interpolator(disaccharide)
+    phi = np.array([105.7, -55.5, 120, 0])
+    psi = np.array([144.3, -105.6, -120, 0])
+    chis = [np.array([65.3, 78.9, 180, 60]), np.array([160.1, -65.8, -60, 60]),
+            np.array([-45.6, 46.79, 60, 60])]
+    cs = interpolator(phi, psi, *chis)
+    np.testing.assert_array_equal(cs, disaccharides_full.compute_cs_many(
+        disaccharide, phi, psi, *chis))
+    # angles are periodic
+    np.testing.assert_almost_equal(interpolator(phi + 360, psi - 720, *chis), cs)
+    # a single populated rotamer is the same as rounding the chi angles
+    populations = np.zeros((3, 3, 3))
+    populations[1, 2, 0] = 1  # chi1=60, chi2=180, chi3=-60
+    np.testing.assert_array_equal(interpolator(phi, psi, populations=populations),
+                                  interpolator(phi, psi, 60, 180, -60))
+    # the average is between the chemical shifts of the rotamers
+    rotamers = [interpolator(phi[:2], psi[:2], chi1, chi2, chi3)
+                for chi1 in (-60, 60, 180) for chi2 in (-60, 60, 180)
+                for chi3 in (-60, 60, 180)]
+    rotamers = np.ma.masked_invalid(rotamers)
+    cs = interpolator(phi[:2], psi[:2], populations=np.ones((3, 3, 3)))
+    np.testing.assert_almost_equal(cs, rotamers.mean(axis=0))
+    # torsionals not defined are outside the zone of computed values
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        cs = interpolator([105.7, np.nan, 105.7], [np.nan, 144.3, 144.3],
+                          65.3, 160.1, -45.6)
+        grad = interpolator.gradient([np.nan], [144.3], 65.3, 160.1, -45.6)
+    assert np.isinf(cs[:2]).all()
+    assert np.all(np.isfinite(cs[2]))
+    assert np.isnan(grad).all()
+
+
+def test_stats():
+    disaccharide = 'a-D-Glcp-1-4-a-D-Glcp'
+    events = []
+    stats = Stats(callback=lambda kind, name, value: events.append(name))
+    stats_test = CheSweet(stats=stats)
+    stats_test.compute_cs(disaccharide, 50, 60)
+    stats_test.compute_cs(disaccharide, -180, 60)
+    stats_test.compute_cs(disaccharide, 180, 180)
+    assert stats.counters['tables_loaded'] == 1
+    assert stats.counters['table_bytes'] == stats_test.lt[disaccharide + '_red'].nbytes
+    assert stats.counters['queries'] == 3
+    assert stats.counters['outside'] == 1
+    for phase in ('load', 'rounding', 'filter', 'griddata'):
+        assert stats.timings[phase] >= 0
+        assert phase in events
+    stats.reset()
+    cs = stats_test.compute_cs_many(disaccharide, [50, -180, 180], [60, 60, 180])
+    assert stats.counters['queries'] == 3
+    assert stats.counters['outside'] == np.isinf(cs[:, 0]).sum()
+    stats_test.compute_tors_many(disaccharide, [109.52, 101.3], [87.68, 80.1])
+    assert stats.counters['tors_queries'] == 2
+    assert set(stats.as_dict()) == {'timings', 'counters'}
+
+    # conformations are counted once, whatever the number of rotamers averaged
+    # or the number of samples used
+    stats = Stats()
+    stats_full = CheSweet(full=True, stats=stats,
+                          disaccharides=['a-D-Galp-1-3-b-D-Galp'])
+    rng = np.random.RandomState(0)
+    phi, psi = rng.uniform(-180, 180, (2, 50))
+    interpolator = stats_full.interpolator('a-D-Galp-1-3-b-D-Galp')
+    interpolator(phi, psi, populations=np.ones((3, 3, 3)), stats=stats)
+    assert stats.counters['queries'] == 50
+    assert 0 < stats.counters['border'] <= 50
+    stats.reset()
+    cs, _ = stats_full.compute_cs_uncertainty('a-D-Galp-1-3-b-D-Galp', phi, psi,
+                                              60, 60, 60, std=2,
+                                              method='montecarlo', n_samples=20)
+    assert stats.counters['queries'] == 50
+    assert stats.counters['outside'] == np.isinf(cs[:, 0]).sum()
+    stats.reset()
+    stats_full.compute_cs_uncertainty('a-D-Galp-1-3-b-D-Galp', rng.normal(0, 1, (3, 20)),
+                                      0, 60, 60, 60)
+    assert stats.counters['queries'] == 3
+
+
+def test_cell_cache():
+    disaccharide = 'a-D-Galp-1-3-b-D-Galp'
+    cache_test = CheSweet(full=True, cell_cache=2)
+    tors = [(105.7, 144.3, 65.3, 160.1, -45.6), (-55.5, -105.6, 78.9, -65.8, 46.79),
+            (101.2, 148.8, 70.1, 155.4, -60.2), (-180, 60, 60, 60, 60)]
+    for tor in tors:
+        np.testing.assert_array_equal(cache_test.compute_cs(disaccharide, *tor),
+                                      disaccharides_full.compute_cs(disaccharide, *tor))
+    # the third conformation is in the same cell and rotamers as the first one
+    assert cache_test.cell_cache.info() == {'hits': 1, 'misses': 3, 'size': 2,
+                                            'maxsize': 2}
+    # the least recently used cell was discarded
+    cache_test.compute_cs(disaccharide, *tors[1])
+    assert cache_test.cell_cache.misses == 4
+    cache_test.cell_cache.clear()
+    assert len(cache_test.cell_cache) == 0
+
+
+def test_tables():
+    info = disaccharides_red.tables['a-D-Glcp-1-6-a-D-Glcp']
+    assert info.key == 'a-D-Glcp-1-6-a-D-Glcp_red'
+    assert (info.donor, info.position) == (1, 6)
+    assert info.columns == ('phi', 'psi', 'omega')
+    np.testing.assert_array_equal(info.rotamers, [[-60, 60, 180]])
+    assert info.n_rows == len(disaccharides_red.lt[info.key])
+    np.testing.assert_almost_equal(info.cs_range(),
+                                   183.4 - info.shielding_range[:, ::-1])
+    info = disaccharides_full.tables['a-D-Glcp-1-1-a-D-Glcp']
+    assert info.key == 'a-D-Glcp-1-1-a-D-Glcp'
+    assert info.columns == ('phi', 'psi', 'chi1', 'chi2')
+    assert len(info.rotamers) == 2
+    for name, info in disaccharides_full.tables.items():
+        assert info.name == name
+        assert len(info.columns) == disaccharides_full.compute_tors_nearest(
+            name, 100, 80, k=1)[0].shape[-1]
+
+
+def test_compact():
+    compact_test = CheSweet(full=True, compact=True)
+    disaccharide = 'a-D-Galp-1-3-b-D-Galp'
+    table = disaccharides_full.lt[disaccharide]
+    compact = compact_test.lt[disaccharide]
+    assert isinstance(compact, CompactTable)
+    assert compact.nbytes * 4 < table.nbytes
+    np.testing.assert_array_equal(compact[:, :-2], table[:, :-2])
+    np.testing.assert_almost_equal(np.asarray(compact), table, decimal=4)
+    rows = np.array([[0, 5], [3, 1]])
+    assert compact[rows, :5].shape == table[rows, :5].shape
+    for tors, chem in zip(full_tors_1_3, full_chem_1_3):
+        cs = compact_test.compute_cs(disaccharide, *tors)
+        if np.isinf(cs[0]):
+            assert np.isinf(chem[0])
+        else:
+            np.testing.assert_almost_equal(ef_corr - cs, chem, decimal=4)
+    np.testing.assert_almost_equal(
+        compact_test.compute_cs_many(disaccharide, *np.transpose(full_tors_1_3)),
+        disaccharides_full.compute_cs_many(disaccharide, *np.transpose(full_tors_1_3)),
+        decimal=4)
+    tors = compact_test.compute_tors(disaccharide, 109.52, 87.68)
+    np.testing.assert_array_equal(tors, disaccharides_full.compute_tors(disaccharide,
+                                                                         109.52, 87.68))
+    # the grids used to compute chemical shifts are compact too
+    assert compact_test._grid_rows[disaccharide].dtype == np.int16
+    grids = [(chesweet.lt[disaccharide].nbytes + chesweet.grid[disaccharide].nbytes +
+              chesweet._grid_rows[disaccharide].nbytes)
+             for chesweet in (compact_test, disaccharides_full)]
+    assert grids[0] * 2.2 < grids[1]
+
+
+def test_compute_posterior():
+    disaccharide = 'a-D-Galp-1-3-b-D-Galp'
+    cs0 = np.array([84.2, 72.7])
+    cs1 = np.array([102.9, 94.4])
+    for chesweet in (disaccharides_red, disaccharides_full):
+        info = chesweet.tables[disaccharide]
+        table = chesweet.lt[info.key]
+        posterior = chesweet.compute_posterior(disaccharide, cs0, cs1,
+                                               sigma=(1., 2.))
+        assert posterior.shape == (2, 37, 37)
+        np.testing.assert_almost_equal(posterior.sum(axis=(1, 2)), [1, 1])
+        for k in range(2):
+            # sum the likelihood of all the rows of the table of each phi/psi
+            ref = np.zeros((37, 37))
+            lik = np.exp(-0.5 * ((ef_corr - table[:, -2] - cs0[k]) ** 2 +
+                                 (ef_corr - table[:, -1] - cs1[k]) ** 2 / 4))
+            np.add.at(ref, (np.searchsorted(info.axes[0], table[:, 0]),
+                            np.searchsorted(info.axes[1], table[:, 1])), lik)
+            np.testing.assert_almost_equal(posterior[k], ref / ref.sum())
+            with np.errstate(divide='ignore'):
+                np.testing.assert_almost_equal(
+                    chesweet.compute_posterior(disaccharide, cs0[k], cs1[k],
+                                               sigma=(1., 2.), log=True),
+                    np.log(posterior[k]))
+    # a prior for the rotamers
+    populations = np.zeros((3, 3, 3))
+    populations[0, 1, 2] = 1.
+    posterior = disaccharides_full.compute_posterior(disaccharide, cs0[0], cs1[0],
+                                                     populations=populations)
+    table = disaccharides_full.lt[disaccharide]
+    rotamer = (table[:, 2] == -60) & (table[:, 3] == 60) & (table[:, 4] == 180)
+    assert posterior[np.isin(info.axes[0], table[rotamer, 0], invert=True)].sum() == 0
+
+
+def test_packed_lut(tmpdir):
+    fname = pack_lut(str(tmpdir.join('lut')))
+    assert fname.endswith('lut.npz')
+    backend = PackedLut(fname)
+    assert backend.metadata['version'] == PackedLut.version
+    assert len(backend.names()) == len(disaccharides_red.lt) + len(disaccharides_full.lt)
+    for chesweet, full in ((disaccharides_red, False), (disaccharides_full, True)):
+        packed = CheSweet(path=fname, full=full)
+        assert sorted(packed.lt) == sorted(chesweet.lt)
+        for disaccharide in packed.lt:
+            np.testing.assert_array_equal(packed.lt[disaccharide],
+                                          chesweet.lt[disaccharide])
+        np.testing.assert_array_equal(
+            packed.compute_cs('a-D-Galp-1-3-b-D-Galp', 105.7, 144.3, 65.3, 160.1, -45.6),
+            chesweet.compute_cs('a-D-Galp-1-3-b-D-Galp', 105.7, 144.3, 65.3, 160.1, -45.6))
+    # a backend object can be passed as path
+    packed = CheSweet(path=backend, disaccharides=['a-D-Glcp-1-1-a-D-Glcp'])
+    assert list(packed.lt) == ['a-D-Glcp-1-1-a-D-Glcp_red']
+    np.savez(str(tmpdir.join('other.npz')), x=np.zeros(3))
+    try:
+        CheSweet(path=str(tmpdir.join('other.npz')))
+        assert False
+    except ValueError:
+        pass
+    # files are only open while reading them
+    import os
+    if os.path.isdir('/proc/self/fd'):
+        open_files = [os.path.realpath(os.path.join('/proc/self/fd', fd))
+                      for fd in os.listdir('/proc/self/fd')]
+        assert os.path.realpath(fname) not in open_files
+        assert os.path.realpath(str(tmpdir.join('other.npz'))) not in open_files
+
+
+def test_lut_directory(tmpdir):
+    import os
+    import shutil
+    folder = os.path.join(os.path.dirname(__file__), '..', 'lut')
+    lut = tmpdir.mkdir('lut')
+    # full tables ending in any letter are found
+    shutil.copy(os.path.join(folder, 'a-D-Glcp-1-1-a-D-Glcp'),
+                str(lut.join('a-D-Glcp-1-1-a-D-Glcpd')))
+    shutil.copy(os.path.join(folder, 'a-D-Glcp-1-1-a-D-Glcp_red'),
+                str(lut.join('a-D-Glcp-1-1-a-D-Glcp_red')))
+    lut.mkdir('subfolder')
+    lut.join('.hidden').write('')
+    assert LutDirectory(str(lut)).names() == ['a-D-Glcp-1-1-a-D-Glcp_red',
+                                              'a-D-Glcp-1-1-a-D-Glcpd']
+    full = CheSweet(path=str(tmpdir), full=True, cache=False)
+    assert list(full.lt) == ['a-D-Glcp-1-1-a-D-Glcpd']
+    red = CheSweet(path=str(tmpdir), cache=False)
+    assert list(red.lt) == ['a-D-Glcp-1-1-a-D-Glcp_red']
+
+
+def test_compute_cs_uncertainty():
+    disaccharide = 'a-D-Galp-1-3-b-D-Galp'
+    phi = np.array([105.7, -55.5, 0, 120])
+    psi = np.array([144.3, -105.6, 0, -120])
+    chis = [np.array([65.3, 78.9, 60, 180]), np.array([160.1, -65.8, 60, -60]),
+            np.array([-45.6, 46.79, 60, 60])]
+    interpolator = disaccharides_full.interpolator(disaccharide)
+    # the gradient is the derivative of the linear interpolation, except
+    # at the nodes of the grid (the fourth conformation)
+    grad = interpolator.gradient(phi, psi, *chis)
+    delta = 1e-4
+    for k in range(2):
+        shifted = [phi, psi]
+        shifted[k] = shifted[k] + delta
+        with np.errstate(invalid='ignore'):
+            ref = (interpolator(*shifted, *chis) - interpolator(phi, psi, *chis)) / delta
+        np.testing.assert_almost_equal(grad[:2, :, k], ref[:2], decimal=4)
+    assert np.isnan(grad[2]).all()
+
+    cs, cs_std = disaccharides_full.compute_cs_uncertainty(disaccharide, phi, psi,
+                                                           *chis, std=[3, 4, 0, 0, 0])
+    np.testing.assert_array_equal(cs, disaccharides_full.compute_cs_many(
+        disaccharide, phi, psi, *chis))
+    np.testing.assert_almost_equal(cs_std[0], np.hypot(3 * grad[0, :, 0],
+                                                       4 * grad[0, :, 1]))
+    assert np.isinf(cs_std[2]).all()
+
+    # Monte Carlo and sample clouds agree with the linear propagation
+    mc, mc_std = disaccharides_full.compute_cs_uncertainty(
+        disaccharide, phi[0], psi[0], chis[0][0], chis[1][0], chis[2][0], std=[1, 1, 0, 0, 0],
+        method='montecarlo', n_samples=5000, seed=0)
+    np.testing.assert_almost_equal(mc, cs[0], decimal=1)
+    np.testing.assert_almost_equal(mc_std, np.hypot(grad[0, :, 0], grad[0, :, 1]),
+                                   decimal=1)
+    rng = np.random.RandomState(0)
+    clouds = [rng.normal(tor[0], 1, (1, 5000)) for tor in [phi, psi]]
+    cloud, cloud_std = disaccharides_full.compute_cs_uncertainty(
+        disaccharide, *clouds, chis[0][0], chis[1][0], chis[2][0])
+    assert cloud.shape == (1, 2)
+    np.testing.assert_almost_equal(cloud[0], mc, decimal=1)
+    np.testing.assert_almost_equal(cloud_std[0], mc_std, decimal=1)
+
+    # clouds of many conformations with one chi value for each conformation
+    clouds = [rng.normal(tor[:2, None], 1, (2, 2000)) for tor in [phi, psi]]
+    cloud, cloud_std = disaccharides_full.compute_cs_uncertainty(
+        disaccharide, *clouds, *[chi[:2] for chi in chis])
+    assert cloud.shape == (2, 2)
+    for i in range(2):
+        ref, ref_std = disaccharides_full.compute_cs_uncertainty(
+            disaccharide, clouds[0][i], clouds[1][i], *[chi[i] for chi in chis])
+        np.testing.assert_almost_equal(cloud[i], ref)
+        np.testing.assert_almost_equal(cloud_std[i], ref_std)
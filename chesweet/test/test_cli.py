@@ -0,0 +1,68 @@
+import io
+import sys
+import numpy as np
+from ..chesweet import CheSweet
+from ..cli import main
+
+disaccharide = 'a-D-Glcp-1-4-a-D-Glcp'
+disaccharides_red = CheSweet(disaccharides=[disaccharide])
+
+tors = np.array([[85.3, 76.8], [90.1, 80.2], [70.4, 101.3], [-60, -60]])
+
+
+def test_cli_cs_stdin(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('85.3 76.8\n# comment\n'
+                                                  '90.1,80.2\n70.4 101.3\n'
+                                                  '-60 -60\n'))
+    assert main(['cs', disaccharide, '--chunk-size', '3']) == 0
+    cs = np.loadtxt(io.StringIO(capsys.readouterr().out))
+    ref = disaccharides_red.compute_cs_many(disaccharide, *tors.T)
+    np.testing.assert_almost_equal(cs, ref, decimal=6)
+
+
+def test_cli_cs_npy(tmpdir):
+    fname = str(tmpdir.join('tors.npy'))
+    output = str(tmpdir.join('cs.npy'))
+    np.save(fname, tors)
+    assert main(['cs', disaccharide, fname, '-o', output, '--chunk-size', '3']) == 0
+    ref = disaccharides_red.compute_cs_many(disaccharide, *tors.T)
+    np.testing.assert_array_equal(np.load(output), ref)
+
+
+def test_cli_tors(tmpdir):
+    fname = str(tmpdir.join('cs.csv'))
+    output = str(tmpdir.join('tors.csv'))
+    cs = np.array([[109.52, 87.68], [100., 80.], [20., 150.]])
+    np.savetxt(fname, cs, delimiter=',', header='cs0,cs1')
+    assert main(['tors', disaccharide, fname, '-o', output, '--chunk-size', '2']) == 0
+    result = np.loadtxt(output, delimiter=',')
+    ref = disaccharides_red.compute_tors_many(disaccharide, cs[:, 0], cs[:, 1])
+    for i in range(len(cs)):
+        np.testing.assert_array_equal(result[result[:, 0] == i, 1:], ref[i])
+
+    assert main(['tors', disaccharide, fname, '-o', output, '-k', '2']) == 0
+    result = np.loadtxt(output, delimiter=',')
+    assert result.shape == (6, 4)
+    np.testing.assert_array_equal(result[:, 0], [0, 0, 1, 1, 2, 2])
+
+
+def _error(argv, capsys):
+    try:
+        main(argv)
+        assert False
+    except SystemExit:
+        pass
+    return capsys.readouterr().err
+
+
+def test_cli_errors(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('85.3 76.8\n'))
+    err = _error(['cs', 'a-D-Glcp-1-5-a-D-Glcp'], capsys)
+    assert 'unknown disaccharide a-D-Glcp-1-5-a-D-Glcp' in err
+    assert '_red' not in err
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('85.3\n'))
+    err = _error(['cs', disaccharide], capsys)
+    assert 'needs 2 columns (phi psi), the input has 1' in err
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('85.3 76.8\n'))
+    err = _error(['cs', disaccharide, '--full'], capsys)
+    assert 'needs 5 columns (phi psi chi1 chi2 chi3)' in err
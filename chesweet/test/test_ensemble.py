@@ -0,0 +1,98 @@
+import pickle
+import numpy as np
+from ..chesweet import CheSweet
+from ..ensemble import EnsembleAverage, fit_populations, fit_lut_populations
+
+disaccharide = 'a-D-Glcp-1-4-a-D-Glcp'
+disaccharides_red = CheSweet(disaccharides=[disaccharide])
+
+
+def test_ensemble_average():
+    rng = np.random.RandomState(0)
+    phi = rng.uniform(-180, 180, 1000)
+    psi = rng.uniform(-180, 180, 1000)
+    weights = rng.uniform(0, 1, 1000)
+    cs = disaccharides_red.compute_cs_many(disaccharide, phi, psi)
+    inside = np.isfinite(cs[:, 0])
+    assert not inside.all()
+    mean = np.average(cs[inside], weights=weights[inside], axis=0)
+    variance = np.average((cs[inside] - mean) ** 2, weights=weights[inside],
+                          axis=0)
+
+    average = EnsembleAverage(disaccharides_red)
+    for start in range(0, 1000, 64):
+        chunk = slice(start, start + 64)
+        average.add(disaccharide, phi[chunk], psi[chunk],
+                    weights=weights[chunk])
+    np.testing.assert_almost_equal(average.mean(disaccharide), mean)
+    np.testing.assert_almost_equal(average.variance(disaccharide), variance)
+    assert average.n_frames(disaccharide) == inside.sum()
+    assert average.n_outside(disaccharide) == (~inside).sum()
+    np.testing.assert_almost_equal(average.outside_weight(disaccharide),
+                                   weights[~inside].sum())
+
+    # averages computed separately (e.g. by other processes) can be merged
+    first = EnsembleAverage(disaccharides_red)
+    first.add(disaccharide, phi[:300], psi[:300], weights=weights[:300])
+    second = EnsembleAverage(disaccharides_red)
+    second.add(disaccharide, phi[300:], psi[300:], weights=weights[300:])
+    second = pickle.loads(pickle.dumps(second))
+    assert second.chesweet is None
+    first.merge(second)
+    np.testing.assert_almost_equal(first.mean(disaccharide), mean)
+    np.testing.assert_almost_equal(first.std(disaccharide), np.sqrt(variance))
+    assert first.n_outside(disaccharide) == (~inside).sum()
+
+
+def test_ensemble_average_outside():
+    average = EnsembleAverage()
+    average.add_cs('bond', [[np.inf, np.inf]], [2.])
+    assert average.linkages == ['bond']
+    assert np.isnan(average.mean('bond')).all()
+    assert average.outside_weight('bond') == 2.
+    average.add_cs('bond', [[100., 80.], [102., 84.]])
+    np.testing.assert_almost_equal(average.mean('bond'), [101., 82.])
+    np.testing.assert_almost_equal(average.variance('bond'), [1., 4.])
+
+
+def test_fit_populations():
+    rng = np.random.RandomState(0)
+    table = disaccharides_red.lt[disaccharide + '_red']
+    design = 183.4 - table[:, -2:].T
+    true = np.zeros(len(table))
+    true[rng.choice(len(table), 3, replace=False)] = [0.5, 0.3, 0.2]
+    observed = design @ true
+
+    populations = fit_populations(design, observed)
+    np.testing.assert_almost_equal(populations.sum(), 1)
+    assert np.all(populations >= 0)
+    np.testing.assert_almost_equal(design @ populations, observed, decimal=3)
+    # NNLS solutions are sparse
+    assert np.count_nonzero(populations) <= 3
+
+    populations = fit_populations(design, observed, sigma=0.1, method='maxent',
+                                  theta=0.01)
+    np.testing.assert_almost_equal(populations.sum(), 1)
+    np.testing.assert_almost_equal(design @ populations, observed, decimal=2)
+    # a large theta keeps the prior
+    populations = fit_populations(design, observed, method='maxent', theta=1e8)
+    np.testing.assert_almost_equal(populations, np.full(len(table), 1 / len(table)))
+
+    # candidates outside the zone of computed values are not used
+    design[:, 0] = np.inf
+    assert fit_populations(design, observed)[0] == 0
+
+
+def test_fit_lut_populations():
+    observed = [(disaccharide, 100., 77.), (disaccharide, 102., 78.)]
+    rows = disaccharides_red.compute_tors_many(disaccharide, [100.], [77.], eps=2.,
+                                               return_index=True)
+    populations = fit_lut_populations(disaccharides_red, observed,
+                                      rows=[rows[0], None])
+    table = disaccharides_red.lt[disaccharide + '_red']
+    assert populations[0].shape == rows[0].shape
+    assert populations[1].shape == (len(table),)
+    for (_, cs0, cs1), candidates, population in zip(observed, [rows[0], slice(None)],
+                                                     populations):
+        np.testing.assert_almost_equal((183.4 - table[candidates, -2:]).T @ population,
+                                       [cs0, cs1], decimal=3)
@@ -0,0 +1,196 @@
+import numpy as np
+from ..chesweet import CheSweet
+from ..glycan import Glycan, read_pdb, find_linkages, dihedrals
+
+disaccharides_red = CheSweet(disaccharides=['a-D-Glcp-1-4-a-D-Glcp'])
+trehalose_full = CheSweet(full=True, disaccharides=['a-D-Glcp-1-1-a-D-Glcp'])
+sucrose = 'a-D-Glcp-1-2-b-D-Fruf'
+
+ef_corr = 183.4
+
+
+def _place(a, b, c, bond, angle, torsion):
+    """
+    Place an atom at `bond` from c, with angle b-c-atom and dihedral
+    a-b-c-atom (in degrees).
+    """
+    angle, torsion = np.radians(angle), np.radians(torsion)
+    bc = (c - b) / np.linalg.norm(c - b)
+    n = np.cross(b - a, bc)
+    n /= np.linalg.norm(n)
+    m = np.cross(n, bc)
+    d = np.array([-bond * np.cos(angle), bond * np.sin(angle) * np.cos(torsion),
+                  bond * np.sin(angle) * np.sin(torsion)])
+    return c + d[0] * bc + d[1] * m + d[2] * n
+
+
+def _maltose(phi, psi):
+    """
+    Atoms of the glycosidic bond of maltose, with the given phi and psi.
+    """
+    c3 = np.array([-1.2, -0.8, 0.3])
+    c4 = np.zeros(3)
+    o4 = np.array([1.43, 0., 0.])
+    c1 = _place(c3, c4, o4, 1.42, 116., 170.)
+    h4 = _place(c1, o4, c4, 1.09, 109.5, psi)
+    h1 = _place(c4, o4, c1, 1.09, 109.5, phi)
+    atoms = [('A', 1, 'GLC', 'C1'), ('A', 1, 'GLC', 'H1'),
+             ('A', 2, 'GLC', 'C3'), ('A', 2, 'GLC', 'C4'),
+             ('A', 2, 'GLC', 'O4'), ('A', 2, 'GLC', 'H4')]
+    return atoms, np.array([c1, h1, c3, c4, o4, h4])
+
+
+def _trehalose(phi, psi, chi1, chi2):
+    """
+    Atoms of the glycosidic bond of trehalose and of the hydroxyls at C2 of
+    both residues, with the given phi, psi, chi1 and chi2.
+    """
+    c1b = np.zeros(3)
+    o1 = np.array([1.43, 0., 0.])
+    c1 = _place(np.array([-0.5, 1.3, 0.]), c1b, o1, 1.42, 116., 170.)
+    h1 = _place(c1b, o1, c1, 1.09, 109.5, phi)
+    h1b = _place(c1, o1, c1b, 1.09, 109.5, psi)
+    coords = [c1, h1]
+    for c1x, ox, h1x, chi in ((c1, o1, h1, chi1), (c1b, o1, h1b, chi2)):
+        c2 = _place(h1x, ox, c1x, 1.53, 109.5, 120.)
+        h2 = _place(ox, c1x, c2, 1.09, 109.5, 60.)
+        o2 = _place(ox, c1x, c2, 1.43, 109.5, -60.)
+        ho2 = _place(h2, c2, o2, 0.96, 109.5, chi)
+        coords += [c2, h2, o2, ho2]
+    coords[6:6] = [o1, c1b, h1b]
+    atoms = [('A', 1, 'GLC', name)
+             for name in ('C1', 'H1', 'C2', 'H2', 'O2', 'HO2')]
+    atoms += [('A', 2, 'GLC', name)
+              for name in ('O1', 'C1', 'H1', 'C2', 'H2', 'O2', 'HO2')]
+    return atoms, np.array(coords)
+
+
+def _sucrose(phi, psi, chi1, chi2, chi3):
+    """
+    Atoms of the glycosidic bond of sucrose and of the substituents next to
+    it, with the given phi, psi and chi angles.
+    """
+    c2f = np.zeros(3)
+    o2 = np.array([1.43, 0., 0.])
+    c1 = _place(np.array([-0.5, 1.3, 0.]), c2f, o2, 1.42, 116., 170.)
+    h1 = _place(c2f, o2, c1, 1.09, 109.5, phi)
+    c2 = _place(h1, o2, c1, 1.53, 109.5, 120.)
+    h2 = _place(o2, c1, c2, 1.09, 109.5, 60.)
+    o2g = _place(o2, c1, c2, 1.43, 109.5, -60.)
+    ho2 = _place(h2, c2, o2g, 0.96, 109.5, chi1)
+    c1f = _place(c1, o2, c2f, 1.53, 109.5, psi)
+    o5f = _place(c1, o2, c2f, 1.43, 109.5, psi + 120.)
+    c3f = _place(c1, o2, c2f, 1.53, 109.5, psi - 120.)
+    o1f = _place(o5f, c2f, c1f, 1.43, 109.5, chi2)
+    h11 = _place(o5f, c2f, c1f, 1.09, 109.5, chi2 + 120.)
+    h12 = _place(o5f, c2f, c1f, 1.09, 109.5, chi2 - 120.)
+    h3f = _place(o2, c2f, c3f, 1.09, 109.5, 60.)
+    o3f = _place(o2, c2f, c3f, 1.43, 109.5, -60.)
+    ho3 = _place(h3f, c3f, o3f, 0.96, 109.5, chi3)
+    atoms = [('A', 1, 'GLC', name)
+             for name in ('C1', 'H1', 'C2', 'H2', 'O2', 'HO2')]
+    atoms += [('A', 2, 'FRU', name)
+              for name in ('C2', 'O2', 'C1', 'O5', 'C3', 'O1', 'H11', 'H12',
+                           'H3', 'O3', 'HO3')]
+    return atoms, np.array([c1, h1, c2, h2, o2g, ho2, c2f, o2, c1f, o5f, c3f,
+                            o1f, h11, h12, h3f, o3f, ho3])
+
+
+def _write_pdb(fname, atoms, frames):
+    with open(fname, 'w') as fh:
+        for model, coords in enumerate(frames):
+            fh.write('MODEL     {:4d}\n'.format(model + 1))
+            for i, ((chain, resnum, resname, name), xyz) in enumerate(zip(atoms, coords)):
+                fh.write('HETATM{:5d} {:<4s} {:3s} {:1s}{:4d}    {:8.3f}{:8.3f}{:8.3f}'
+                         '  1.00  0.00\n'.format(i + 1, name, resname, chain,
+                                                 resnum, *xyz))
+            fh.write('ENDMDL\n')
+
+
+def test_dihedrals():
+    for phi, psi in [(85.3, 76.8), (-120., 170.), (180., -5.)]:
+        atoms, coords = _maltose(phi, psi)
+        angles = dihedrals(coords[None], [[1, 0, 4, 3], [0, 4, 3, 5], [-1, 0, 1, 2]])
+        np.testing.assert_almost_equal(angles[0, :2], [phi, psi])
+        assert np.isnan(angles[0, 2])
+
+
+def test_find_linkages():
+    atoms, coords = _maltose(85.3, 76.8)
+    linkages = find_linkages(atoms, coords)
+    assert len(linkages) == 1
+    assert linkages[0].disaccharide == 'a-D-Glcp-1-4-a-D-Glcp'
+    assert linkages[0].position == 4
+    linkages = find_linkages(atoms, coords, residue_names={('A', 2): 'b-D-Glcp'})
+    assert linkages[0].disaccharide == 'a-D-Glcp-1-4-b-D-Glcp'
+    # without H4 psi is not defined, C3 is only used for 1-6 bonds
+    linkages = find_linkages(atoms[:-1], coords[:-1])
+    assert np.all(linkages[0].atoms[1] == -1)
+
+
+def test_glycan_compute_cs(tmpdir):
+    tors = np.array([(85.3, 76.8), (90.1, 80.2), (70.4, 101.3), (-60, -60)])
+    frames = []
+    for phi, psi in tors:
+        atoms, coords = _maltose(phi, psi)
+        frames.append(coords)
+    fname = str(tmpdir.join('maltose.pdb'))
+    _write_pdb(fname, atoms, frames)
+
+    atoms, frames = read_pdb(fname)
+    frames = list(frames)
+    assert len(frames) == len(tors)
+    glycan = Glycan(disaccharides_red, atoms, frames[0])
+    assert len(glycan.linkages) == 1
+    # coordinates in the PDB file are rounded
+    np.testing.assert_allclose(glycan.torsionals(frames)[:, 0, :2], tors,
+                               atol=0.1)
+    cs = np.concatenate(list(glycan.compute_cs(iter(frames), chunk_size=3)))
+    assert cs.shape == (len(tors), 1, 2)
+    ref = disaccharides_red.compute_cs_many('a-D-Glcp-1-4-a-D-Glcp',
+                                            *glycan.torsionals(frames)[:, 0, :2].T)
+    np.testing.assert_array_equal(cs[:, 0], ref)
+
+
+def test_glycan_compute_cs_full_1_1():
+    tors = np.array([(-70., 100., 180., -60.), (-60., 110., 60., 60.)])
+    frames = []
+    for phi, psi, chi1, chi2 in tors:
+        atoms, coords = _trehalose(phi, psi, chi1, chi2)
+        frames.append(coords)
+    glycan = Glycan(trehalose_full, atoms, frames[0])
+    assert len(glycan.linkages) == 1
+    assert glycan.linkages[0].disaccharide == 'a-D-Glcp-1-1-a-D-Glcp'
+    angles = glycan.torsionals(frames)[:, 0]
+    np.testing.assert_allclose(angles[:, :4], tors, atol=1e-6)
+    assert np.all(np.isnan(angles[:, 4]))
+    cs = np.concatenate(list(glycan.compute_cs(frames)))
+    assert np.all(np.isfinite(cs))
+    ref = trehalose_full.compute_cs_many('a-D-Glcp-1-1-a-D-Glcp', *tors.T)
+    np.testing.assert_allclose(cs[:, 0], ref)
+
+
+def test_glycan_compute_cs_ketose():
+    # Fruf has no H2, psi is C1-O2'-C2'-C1'
+    tors = np.array([(15., -165., 60., -60., -60.), (10., -175., 60., -60., -60.)])
+    frames = [_sucrose(*tor)[1] for tor in tors]
+    atoms = _sucrose(*tors[0])[0]
+    for full in (False, True):
+        disaccharides = CheSweet(full=full, disaccharides=[sucrose])
+        glycan = Glycan(disaccharides, atoms, frames[0])
+        assert len(glycan.linkages) == 1
+        assert glycan.missing == []
+        assert glycan.linkages[0].disaccharide == sucrose
+        angles = glycan.torsionals(frames)[:, 0]
+        np.testing.assert_allclose(angles, tors, atol=1e-6)
+        cs = np.concatenate(list(glycan.compute_cs(frames)))
+        assert np.all(np.isfinite(cs))
+        ref = disaccharides.compute_cs_many(sucrose, *tors.T)
+        np.testing.assert_allclose(cs[:, 0], ref)
+
+    # without the atoms of psi the bond can not be computed
+    keep = [i for i, atom in enumerate(atoms) if atom[3] != 'C1' or atom[1] != 2]
+    glycan = Glycan(disaccharides, [atoms[i] for i in keep], frames[0][keep])
+    assert glycan.linkages == []
+    assert len(glycan.missing) == 1
+    assert glycan.missing[0].disaccharide == sucrose
@@ -0,0 +1,47 @@
+import numpy as np
+from ..chesweet import CheSweet
+from ..parallel import ParallelCheSweet
+
+disaccharides = ['a-D-Glcp-1-1-a-D-Glcp', 'b-D-Galp-1-6-b-D-Galp']
+
+
+def test_parallel_compute_cs_many():
+    rng = np.random.RandomState(0)
+    phi = rng.uniform(-180, 180, 1000)
+    psi = rng.uniform(-180, 180, 1000)
+    omega = rng.choice([-60, 60, 180], 1000)
+    disaccharides_red = CheSweet(disaccharides=disaccharides)
+    with ParallelCheSweet(disaccharides=disaccharides, processes=2,
+                          chunk_size=300) as parallel:
+        for disaccharide in disaccharides:
+            cs = parallel.compute_cs_many(disaccharide, phi, psi, omega)
+            ref = disaccharides_red.compute_cs_many(disaccharide, phi, psi, omega)
+            np.testing.assert_array_equal(cs, ref)
+
+
+def test_parallel_compute_tors_many():
+    cs0 = np.linspace(70, 90, 50)
+    cs1 = np.linspace(80, 115, 50)
+    disaccharides_red = CheSweet(disaccharides=disaccharides)
+    with ParallelCheSweet(disaccharides=disaccharides, processes=2,
+                          chunk_size=7) as parallel:
+        tors = parallel.compute_tors_many(disaccharides[1], cs0, cs1, eps=1.)
+    ref = disaccharides_red.compute_tors_many(disaccharides[1], cs0, cs1, eps=1.)
+    assert len(tors) == len(ref)
+    for x, y in zip(tors, ref):
+        np.testing.assert_array_equal(x, y)
+
+
+def test_parallel_disaccharides():
+    try:
+        ParallelCheSweet(disaccharides=['a-D-Glcp-1-5-a-D-Glcp'], processes=1)
+        assert False
+    except ValueError:
+        pass
+    # without the binary copy each worker reads the text files
+    with ParallelCheSweet(disaccharides=disaccharides[:1], cache=False,
+                          processes=1) as parallel:
+        cs = parallel.compute_cs_many(disaccharides[0], [85.3], [76.8])
+    ref = CheSweet(disaccharides=disaccharides[:1]).compute_cs_many(
+        disaccharides[0], [85.3], [76.8])
+    np.testing.assert_array_equal(cs, ref)
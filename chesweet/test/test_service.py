@@ -0,0 +1,102 @@
+import asyncio
+import json
+import numpy as np
+from ..chesweet import CheSweet
+from ..service import AsyncCheSweet, serve
+
+disaccharide = 'a-D-Glcp-1-4-a-D-Glcp'
+disaccharides_red = CheSweet(disaccharides=[disaccharide])
+
+
+class _Counter():
+    """
+    CheSweet counting the batches computed.
+    """
+
+    def __init__(self, chesweet):
+        self.chesweet = chesweet
+        self.batches = []
+
+    def compute_cs_many(self, *args, **kwargs):
+        self.batches.append(len(args[1]))
+        return self.chesweet.compute_cs_many(*args, **kwargs)
+
+    def compute_tors_many(self, *args, **kwargs):
+        self.batches.append(len(args[1]))
+        return self.chesweet.compute_tors_many(*args, **kwargs)
+
+
+def test_async_compute_cs():
+    rng = np.random.RandomState(0)
+    phi = rng.uniform(-180, 180, 50)
+    psi = rng.uniform(-180, 180, 50)
+    counter = _Counter(disaccharides_red)
+    service = AsyncCheSweet(counter, delay=0.01)
+
+    async def requests():
+        return await asyncio.gather(
+            *[service.compute_cs(disaccharide, p, s) for p, s in zip(phi, psi)],
+            service.compute_cs(disaccharide, phi[:3], psi[:3]))
+
+    results = asyncio.run(requests())
+    service.close()
+    # all the requests are computed in one batch
+    assert counter.batches == [53]
+    ref = disaccharides_red.compute_cs_many(disaccharide, phi, psi)
+    np.testing.assert_array_equal(results[:-1], ref)
+    np.testing.assert_array_equal(results[-1], ref[:3])
+
+
+def test_async_compute_tors():
+    cs0 = [109.52, 100., 20.]
+    cs1 = [87.68, 80., 150.]
+    counter = _Counter(disaccharides_red)
+    service = AsyncCheSweet(counter, max_batch=2)
+
+    async def requests():
+        return await asyncio.gather(
+            *[service.compute_tors(disaccharide, c0, c1) for c0, c1 in zip(cs0, cs1)])
+
+    results = asyncio.run(requests())
+    service.close()
+    assert counter.batches == [2, 1]
+    ref = disaccharides_red.compute_tors_many(disaccharide, cs0, cs1)
+    for result, tors in zip(results, ref):
+        np.testing.assert_array_equal(result, tors)
+
+
+def test_serve():
+    service = AsyncCheSweet(disaccharides_red)
+
+    async def post(port, path, params):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        body = json.dumps(params).encode()
+        writer.write('POST {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(
+            path, len(body)).encode() + body)
+        response = await reader.read()
+        writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body.decode())
+
+    async def requests():
+        server = await serve(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(
+                post(port, '/cs', {'disaccharide': disaccharide,
+                                   'phi': [85.3, -60], 'psi': [76.8, -60]}),
+                post(port, '/tors', {'disaccharide': disaccharide,
+                                     'cs0': 109.52, 'cs1': 87.68}),
+                post(port, '/cs', {'disaccharide': 'unknown', 'phi': 0, 'psi': 0}),
+                post(port, '/other', {}))
+
+    (status_cs, cs), (status_tors, tors), (status_error, error), \
+        (status_404, _) = asyncio.run(requests())
+    service.close()
+    assert (status_cs, status_tors, status_error, status_404) == (200, 200, 400, 404)
+    ref = disaccharides_red.compute_cs_many(disaccharide, [85.3, -60], [76.8, -60])
+    np.testing.assert_almost_equal(cs['cs'][0], ref[0])
+    assert cs['cs'][1] == [None, None]
+    np.testing.assert_array_equal(
+        tors['tors'][0], disaccharides_red.compute_tors(disaccharide, 109.52, 87.68))
+    assert 'error' in error
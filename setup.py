@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='chesweet',
       version='0.0.1',
@@ -8,5 +8,6 @@ setup(name='chesweet',
       url='https://github.com/BIOS-IMASL/chesweet',
       packages=['chesweet'],
       install_requires=['numpy', 'scipy'],
-      include_package_data = True
+      include_package_data = True,
+      entry_points={'console_scripts': ['chesweet = chesweet.cli:main']}
     )